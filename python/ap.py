@@ -1,5 +1,8 @@
+import hashlib
+import inspect
 import itertools
 import numpy as np
+import os
 import pandas as pd
 import scipy.stats
 
@@ -103,6 +106,145 @@ def _load_pairs(df, extra_cols=[]):
     return df
 
 
+def _get_cache_fname(corpus_id, nrm_type, extra_paired_cols):
+    ''' returns cache filename for given load_data arguments
+
+    the name includes the latest modification time of the database and of the
+    big table script, and a hash of the code (and feature lists) that builds
+    the dataframe from them, so any change to these leads to a new filename;
+    parts are separated by "@" (which cannot occur in corpus ids, types of
+    normalization, or column names), see clear_cache
+    '''
+    cols = '+'.join(extra_paired_cols)
+    assert '@' not in corpus_id + nrm_type + cols, 'invalid cache arguments'
+    stamp = max(
+        os.stat(cfg.get_db_fname(corpus_id)).st_mtime_ns,
+        os.stat(cfg.SQL_PATH + cfg.get_bt_fname(corpus_id)).st_mtime_ns)
+    code = ''.join([inspect.getsource(func) for func in [
+        load_data, _normalize_features, _load_pairs, _compute_sims]])
+    code += repr((cfg.FEATURES, cfg.FEATURES_ALL))
+    code_hash = hashlib.md5(code.encode('utf-8')).hexdigest()[:12]
+    return 'bt@%s@%s@%s@%d@%s.pkl' \
+        % (corpus_id, nrm_type, cols, stamp, code_hash)
+
+
+def _get_grp_codes(arrays):
+    ''' assigns integer codes to groups of rows with identical keys
+
+    args:
+        arrays: list of equally long arrays, one per key component
+    returns:
+        numpy array with group code per row and dictionary with code per
+        group key (tuple), in sorted order of keys (same as pandas groupby)
+    '''
+    codes, uniques = pd.MultiIndex.from_arrays(arrays).factorize(sort=True)
+    return codes, {key: i for i, key in enumerate(uniques)}
+
+
+def _get_pearsons(codes, n_groups, x, y):
+    ''' computes pearson correlations of x and y for all groups and columns
+
+    results match scipy.stats.pearsonr per group and column (r and p are nan
+    for constant input, p is 1 for two observations); rows with nan in x or
+    y are excluded
+
+    args:
+        codes: numpy array with group index per row (0 to n_groups-1)
+        n_groups: number of groups
+        x, y: 2d numpy arrays with paired values (one row per observation)
+    returns:
+        dictionary with 2d numpy arrays (one row per group, one column per
+        column in x and y) of correlation coefficients ("r"), p-values ("p"),
+        numbers of observations ("n"), and whether the standard deviation of
+        x is 0 ("x_std0", as computed by np.std)
+    '''
+    shape = (n_groups, x.shape[1])
+    stats = {k: np.full(shape, np.nan) for k in ['r', 'p']}
+    stats['n'] = np.zeros(shape, dtype=int)
+    stats['x_std0'] = np.zeros(shape, dtype=bool)
+    for j in range(x.shape[1]):
+        ok = pd.notna(x[:, j]) & pd.notna(y[:, j])
+        grp = codes[ok]
+        xs = x[ok, j].astype(float)
+        ys = y[ok, j].astype(float)
+        n = np.bincount(grp, minlength=n_groups)
+        # constant input (all values equal)
+        is_const = []
+        for vals in [xs, ys]:
+            mins = np.full(n_groups, np.inf)
+            maxs = np.full(n_groups, -np.inf)
+            np.minimum.at(mins, grp, vals)
+            np.maximum.at(maxs, grp, vals)
+            is_const += [mins == maxs]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # centered sums of squares and products (two-pass)
+            xms = xs - (np.bincount(grp, xs, minlength=n_groups) / n)[grp]
+            yms = ys - (np.bincount(grp, ys, minlength=n_groups) / n)[grp]
+            sxx = np.bincount(grp, xms * xms, minlength=n_groups)
+            syy = np.bincount(grp, yms * yms, minlength=n_groups)
+            sxy = np.bincount(grp, xms * yms, minlength=n_groups)
+            r = np.clip(sxy / np.sqrt(sxx) / np.sqrt(syy), -1.0, 1.0)
+        r[is_const[0] | is_const[1]] = np.nan
+        # distribution of r under null hypothesis: beta on (-1, 1) with
+        # a = b = n/2 - 1; exactly 1.0 for two observations
+        ab = np.where(n > 2, n / 2 - 1, 1.0)
+        p = 2 * scipy.stats.beta.sf(np.abs(r), ab, ab, loc=-1, scale=2)
+        r = np.where(n == 2, np.round(r), r)
+        p = np.where((n == 2) & ~np.isnan(r), 1.0, p)
+        stats['r'][:, j] = r
+        stats['p'][:, j] = p
+        stats['n'][:, j] = n
+        # constant x usually, but not always, has np.std of exactly 0
+        # (rounding of mean), so check these few groups individually
+        order = np.argsort(grp, kind='stable')
+        ends = np.cumsum(n)
+        for i in np.flatnonzero(is_const[0]):
+            stats['x_std0'][i, j] = \
+                np.std(xs[order[ends[i]-n[i]:ends[i]]]) == 0
+    return stats
+
+
+def _get_paired_ttests(codes, n_groups, a, b):
+    ''' runs paired t-tests of a vs. b for all groups and columns at once
+
+    results match scipy.stats.ttest_rel per group and column: rows with nan in
+    a are excluded, nan in b leads to nan t-statistic and p-value
+
+    args:
+        codes: numpy array with group index per row (0 to n_groups-1)
+        n_groups: number of groups
+        a, b: 2d numpy arrays with paired values (one row per observation)
+    returns:
+        dictionary with 2d numpy arrays (one row per group, one column per
+        column in a and b) of t-statistics ("t"), p-values ("p"), numbers of
+        observations ("n"), and mean differences ("mean", skipping nan)
+    '''
+    shape = (n_groups, a.shape[1])
+    stats = {k: np.zeros(shape) for k in ['t', 'p', 'mean']}
+    stats['n'] = np.zeros(shape, dtype=int)
+    for j in range(a.shape[1]):
+        ok = pd.notna(a[:, j])
+        grp = codes[ok]
+        diffs = a[ok, j] - b[ok, j]
+        is_nan = np.isnan(diffs)
+        diffs = np.where(is_nan, 0.0, diffs)
+        n = np.bincount(grp, minlength=n_groups)
+        n_vals = np.bincount(grp, ~is_nan, minlength=n_groups)
+        sums = np.bincount(grp, diffs, minlength=n_groups)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            means = sums / n
+            # sum of squared deviations (two-pass for numerical stability)
+            sqs = np.bincount(grp, (diffs - means[grp]) ** 2, 
+                              minlength=n_groups)
+            t = means / np.sqrt(sqs / (n - 1) / n)
+            stats['mean'][:, j] = sums / n_vals
+        t[np.bincount(grp, is_nan, minlength=n_groups) > 0] = np.nan
+        stats['t'][:, j] = t
+        stats['p'][:, j] = 2 * scipy.stats.t.sf(np.abs(t), n - 1)
+        stats['n'][:, j] = n
+    return stats
+
+
 def _exclude_woz_and_x(df_bt):
     ''' filters woz sessions and non-adjacent pairs out of given dataframe '''
     df_sub = df_bt[(df_bt['spk_id'] != 0)&(df_bt['partner_spk_id'] != 0)]
@@ -114,19 +256,29 @@ def _exclude_woz_and_x(df_bt):
 #                                MAIN FUNCTIONS                                #
 ################################################################################
 
-def load_data(corpus_id, nrm_type, extra_paired_cols=[]):
+def load_data(corpus_id, nrm_type, extra_paired_cols=[], use_cache=True):
     ''' loads data into one wide dataframe with redundant info 
     
+    results are cached on disk (in cfg.CACHE_PATH) per combination of
+    arguments; a cached result is used only if neither the database, the big
+    table script, nor the code of this module that builds the dataframe
+    changed since it was stored (see also clear_cache)
+
     args: 
         corpus_id: one of the constants in cfg.CORPUS_ID
         nrm_type: how to normalize features (see cfg.NRM_TYPES)
         extra_paired_cols: extra columns, in addition to features, to include 
             regarding paired chunks
+        use_cache: whether to load from and store in cache
     returns:
         pandas dataframe with data per chunk (or chunk pair, where applicable),
         with running index (not chu_id because non-adjacent chunk pairs lead to 
         multiple rows per chunk)
     '''
+    if use_cache:
+        cache_fname = _get_cache_fname(corpus_id, nrm_type, extra_paired_cols)
+        if os.path.exists(cfg.CACHE_PATH + cache_fname):
+            return pd.read_pickle(cfg.CACHE_PATH + cache_fname)
     # load raw data ("big table" dataframe with redundant info)
     df_bt = db.pd_read_sql_query(sql_fname=cfg.get_bt_fname(corpus_id))
     # normalize features as needed
@@ -134,9 +286,42 @@ def load_data(corpus_id, nrm_type, extra_paired_cols=[]):
     # add features of paired chunks (partner and non-partner) to each row and
     # compute similarity for each pair and all features
     df_bt = _load_pairs(df_bt, extra_paired_cols)
+    if use_cache:
+        # replace outdated cache files for the same arguments
+        clear_cache(corpus_id, nrm_type, extra_paired_cols)
+        os.makedirs(cfg.CACHE_PATH, exist_ok=True)
+        df_bt.to_pickle(cfg.CACHE_PATH + cache_fname)
     return df_bt
 
 
+def clear_cache(corpus_id=None, nrm_type=None, extra_paired_cols=None):
+    ''' removes cached load_data results, all or only those for given args
+
+    args:
+        corpus_id: only remove results for this corpus (all if None)
+        nrm_type: only remove results for this normalization (all if None)
+        extra_paired_cols: only remove results for these extra columns (all
+            if None)
+    returns:
+        number of removed cache files
+    '''
+    if not os.path.isdir(cfg.CACHE_PATH):
+        return 0
+    cnt = 0
+    for fname in os.listdir(cfg.CACHE_PATH):
+        if not fname.startswith('bt@') or not fname.endswith('.pkl'):
+            continue
+        # filename format: see _get_cache_fname
+        cid, nrm, cols = fname[3:-4].split('@')[:3]
+        if (corpus_id is None or corpus_id == cid) \
+        and (nrm_type is None or nrm_type == nrm) \
+        and (extra_paired_cols is None
+             or '+'.join(extra_paired_cols) == cols):
+            os.remove(cfg.CACHE_PATH + fname)
+            cnt += 1
+    return cnt
+
+
 def lsim(df_bt, grp_by=cfg.GRP_BYS):
     ''' computes local similarity for given data, per session, task, and speaker
 
@@ -149,17 +334,23 @@ def lsim(df_bt, grp_by=cfg.GRP_BYS):
         freedom), indexed by session type, ses_id, tsk_id, and spk_id
         (0 for any index component means "all", e.g., all sessions of a type)
     '''
-    def __lsim_test(df, f, key, level):
-        ''' runs sanity check and the actual t-test for local similarity '''
-        # exclude arrays that are too short (pearsonr undefined)
-        if len(df.xs(key, level=level)) < 2:
-            return (np.nan, np.nan, len(df.xs(key, level=level))-1)
-        else:
-            return scipy.stats.ttest_rel(
-                df.xs(key, level=level)[f + '_sim_p'], 
-                df.xs(key, level=level)[f + '_sim_x']) \
-                + (len(df.xs(key, level=level))-1,
-                   df.xs(key, level=level)[f + '_lsim'].mean())
+    def __get_stats(levels):
+        ''' runs t-tests for all groups at given index levels and features '''
+        codes, grp_idx = _get_grp_codes(
+            [df_sims.index.get_level_values(l) for l in levels])
+        stats = _get_paired_ttests(codes, len(grp_idx), sims_p, sims_x)
+        return grp_idx, stats
+
+    def __lsim_result(grp_stats, key, j):
+        ''' returns result tuple for given group and feature '''
+        grp_idx, stats = grp_stats
+        i = grp_idx[key]
+        n = int(stats['n'][i, j])
+        # groups that are too short are excluded (t-test undefined)
+        if n < 2:
+            return (np.nan, np.nan, n-1)
+        return (stats['t'][i, j], stats['p'][i, j], n-1, stats['mean'][i, j])
+
     assert len(grp_by) > 0, 'at least one grp_by value needed'
     for g in grp_by:
         assert g in cfg.GRP_BYS, 'unknown grp_by value found'
@@ -171,43 +362,66 @@ def lsim(df_bt, grp_by=cfg.GRP_BYS):
     # self-join to get values for both adjacent and non-adjacent in each row
     df_sims = pd.DataFrame(df_sims.xs('p', level=5)).join( 
         df_sims.xs('x', level=5), lsuffix='_p', rsuffix='_x')
-    # compute local similarity per feature, overall and per task, session, spk
+    sims_p = df_sims.loc[:, [f + '_sim_p' for f in cfg.FEATURES]].to_numpy()
+    sims_x = df_sims.loc[:, [f + '_sim_x' for f in cfg.FEATURES]].to_numpy()
+    # compute local similarity (adjacent minus non-adjacent similarity) for
+    # all groups and features at once; groups are identified by index levels
+    # (tsk_id and ses_id are unique, so, e.g., task level alone suffices)
+    grp_stats = {
+        cfg.GRP_BY_SES_TYPE: __get_stats(['ses_type']),
+        cfg.GRP_BY_SES: __get_stats(['ses_id']),
+        cfg.GRP_BY_SES_SPK: __get_stats(['ses_id', 'spk_id']),
+        cfg.GRP_BY_TSK: __get_stats(['tsk_id']),
+        cfg.GRP_BY_TSK_SPK: __get_stats(['tsk_id', 'spk_id'])
+    }
+    # all speakers in tasks, in index order, with number of observations
+    tsk_spks = df_sims.index.droplevel('chu_id').unique()
+    tsk_spk_idx, tsk_spk_stats = grp_stats[cfg.GRP_BY_TSK_SPK]
     results = {f: {} for f in cfg.FEATURES}
-    for f in cfg.FEATURES:
-        lsims = df_sims[f + '_sim_p'] - df_sims[f + '_sim_x']
-        lsims.name = '%s_lsim' % f
-        df_sims = df_sims.join(lsims)
-        # exclude nan (NULL) feature values
-        df_sims_f = df_sims[pd.notna(df_sims[f + '_sim_p'])]
+    for j, f in enumerate(cfg.FEATURES):
+        # ids of sessions per type, speakers and tasks per session, and
+        # speakers per task, in order of appearance; only groups with non-nan
+        # (non-NULL) feature values are included
+        ses_ids = {}
+        ses_spk_ids = {}
+        tsk_ids = {}
+        tsk_spk_ids = {}
+        for ses_type, ses_id, tsk_id, spk_id in tsk_spks:
+            if tsk_spk_stats['n'][tsk_spk_idx[(tsk_id, spk_id)], j] == 0:
+                continue
+            ses_ids.setdefault(ses_type, []).append(ses_id)
+            ses_spk_ids.setdefault(ses_id, []).append(spk_id)
+            tsk_ids.setdefault(ses_id, []).append(tsk_id)
+            tsk_spk_ids.setdefault(tsk_id, []).append(spk_id)
+        # (same set iteration order as when collecting ids from the index)
         for ses_type in set(df_bt['ses_type']):
             # result for entire session type
             if cfg.GRP_BY_SES_TYPE in grp_by:
-                results[f][(ses_type, 0, 0, 0)] = \
-                    __lsim_test(df_sims_f, f, ses_type, 0)
-            for ses_id in set([v[0] for v in df_sims_f.loc[ses_type].index]):
+                results[f][(ses_type, 0, 0, 0)] = __lsim_result(
+                    grp_stats[cfg.GRP_BY_SES_TYPE], (ses_type,), j)
+            for ses_id in set(ses_ids[ses_type]):
                 # result per session, symmetric measure for both speakers
                 if cfg.GRP_BY_SES in grp_by:
-                    results[f][(ses_type, ses_id, 0, 0)] = \
-                        __lsim_test(df_sims_f, f, ses_id, 1)
-                for spk_id \
-                in set([v[2] for v in df_sims_f.xs(ses_id, level=1).index]):
+                    results[f][(ses_type, ses_id, 0, 0)] = __lsim_result(
+                        grp_stats[cfg.GRP_BY_SES], (ses_id,), j)
+                for spk_id in set(ses_spk_ids[ses_id]):
                     # result per session, asymmetric measure per speaker
                     if cfg.GRP_BY_SES_SPK in grp_by:
                         results[f][(ses_type, ses_id, 0, spk_id)] = \
-                            __lsim_test(df_sims_f, f, (ses_id, spk_id), (1, 3))
-                for tsk_id \
-                in set([v[1] for v in df_sims_f.xs(ses_id, level=1).index]):
+                            __lsim_result(grp_stats[cfg.GRP_BY_SES_SPK],
+                                          (ses_id, spk_id), j)
+                for tsk_id in set(tsk_ids[ses_id]):
                     # result per task, symmetric measure for both speakers
                     if cfg.GRP_BY_TSK in grp_by:
                         results[f][(ses_type, ses_id, tsk_id, 0)] = \
-                            __lsim_test(df_sims_f, f, tsk_id, 2)
-                    for spk_id \
-                    in set([v[2] for v in df_sims_f.xs(tsk_id, level=2).index]):
+                            __lsim_result(grp_stats[cfg.GRP_BY_TSK],
+                                          (tsk_id,), j)
+                    for spk_id in set(tsk_spk_ids[tsk_id]):
                         # result per task, asymmetric measure per speaker
                         if cfg.GRP_BY_TSK_SPK in grp_by:
                             results[f][(ses_type, ses_id, tsk_id, spk_id)] = \
-                                __lsim_test(
-                                    df_sims_f, f, (tsk_id, spk_id), (2, 3))
+                                __lsim_result(grp_stats[cfg.GRP_BY_TSK_SPK],
+                                              (tsk_id, spk_id), j)
     return aux.get_df(results, ['ses_type', 'ses_id', 'tsk_id', 'spk_id'])
 
 
@@ -223,49 +437,78 @@ def syn(df_bt, grp_by=[g for g in cfg.GRP_BYS if g != cfg.GRP_BY_SES_TYPE]):
         indexed by session type, ses_id, tsk_id, and spk_id
         (0 for any index component means "all", e.g., all sessions of a type)
     '''
-    def __syn_test(df, f):
-        ''' runs sanity checks and the actual pearsonr for synchrony '''
+    def __syn_result(grp_stats, key, j):
+        ''' returns result tuple for given group and feature '''
+        grp_idx, stats = grp_stats
+        i = grp_idx[key]
+        n = int(stats['n'][i, j])
         # exclude arrays that are too short or constant (pearsonr undefined)
-        if len(df) < 2 or np.std(df[f]) == 0:
-            return (np.nan, np.nan, len(df)-2)
-        else:
-            # compute correlation between turn-final and turn-initial chunks
-            return scipy.stats.pearsonr(df[f], df[f + '_paired']) + (len(df)-2,)
-            # _run_permutation_check(df[f], df[f + '_paired'])
-            # removed because permutation check no longer deemed necessary 
+        if n < 2 or stats['x_std0'][i, j]:
+            return (np.nan, np.nan, n-2)
+        # correlation between turn-final and turn-initial chunks
+        return (stats['r'][i, j], stats['p'][i, j], n-2)
+        # (for permutation p-values and bootstrap intervals see resample.py)
     assert len(grp_by) > 0, 'at least one grp_by value needed'
     for g in grp_by:
         assert g in cfg.GRP_BYS, 'unknown grp_by value found'
         assert g != cfg.GRP_BY_SES_TYPE, 'unsupported grp_by value found'
-    # compute synchrony for each feature per task, session, and speaker
+    # compute synchrony for all groups and features at once
+    df_p = df_bt[df_bt['p_or_x'] == 'p']
+    x = df_p.loc[:, cfg.FEATURES].to_numpy(dtype=float)
+    y = df_p.loc[:, [f + '_paired' for f in cfg.FEATURES]].to_numpy(dtype=float)
+    grp_stats = {}
+    for g, cols in [(cfg.GRP_BY_SES, []),
+                    (cfg.GRP_BY_SES_SPK, ['spk_id']),
+                    (cfg.GRP_BY_TSK, ['tsk_id']),
+                    (cfg.GRP_BY_TSK_SPK, ['tsk_id', 'spk_id'])]:
+        codes, grp_idx = _get_grp_codes(
+            [df_p[c].to_numpy() for c in ['ses_type', 'ses_id'] + cols])
+        grp_stats[g] = \
+            (grp_idx, _get_pearsons(codes, len(grp_idx), x, y))
+    # speakers and tasks per session, speakers per task (sorted)
+    ses_spks = {}
+    ses_tsks = {}
+    for ses_type, ses_id, spk_id in grp_stats[cfg.GRP_BY_SES_SPK][0]:
+        ses_spks.setdefault(ses_id, []).append(spk_id)
+    for ses_type, ses_id, tsk_id in grp_stats[cfg.GRP_BY_TSK][0]:
+        ses_tsks.setdefault(ses_id, []).append(tsk_id)
+    tsk_spks = {}
+    for ses_type, ses_id, tsk_id, spk_id in grp_stats[cfg.GRP_BY_TSK_SPK][0]:
+        tsk_spks.setdefault((ses_id, tsk_id), []).append(spk_id)
+    # collect results per task, session, and speaker; groups without 
+    # non-nan (non-NULL) feature values are skipped (except for sessions)
+    has_vals = lambda g, key, j: \
+        grp_stats[g][1]['n'][grp_stats[g][0][key], j] > 0
     results = {f: {} for f in cfg.FEATURES}
-    for (ses_type, ses_id), df_grp_ses \
-    in df_bt[df_bt['p_or_x'] == 'p'].groupby(['ses_type', 'ses_id']):
-        for f in cfg.FEATURES:
-            # exclude nan (NULL) feature values
-            df_grp_ses_f = df_grp_ses[pd.notna(df_grp_ses[f])]
-            df_grp_ses_f = df_grp_ses_f[pd.notna(df_grp_ses_f[f + '_paired'])]
+    for ses_type, ses_id in grp_stats[cfg.GRP_BY_SES][0]:
+        for j, f in enumerate(cfg.FEATURES):
             # result per session, symmetric measure for both speakers
             if cfg.GRP_BY_SES in grp_by:
-                results[f][(ses_type, ses_id, 0, 0)] = \
-                    __syn_test(df_grp_ses_f, f)
-            for spk_id, df_grp_ses_spk \
-            in df_grp_ses_f.groupby('spk_id'):
+                results[f][(ses_type, ses_id, 0, 0)] = __syn_result(
+                    grp_stats[cfg.GRP_BY_SES], (ses_type, ses_id), j)
+            for spk_id in ses_spks[ses_id]:
+                key = (ses_type, ses_id, spk_id)
                 # result per session, asymmetric measure per speaker
-                if cfg.GRP_BY_SES_SPK in grp_by:
+                if cfg.GRP_BY_SES_SPK in grp_by \
+                and has_vals(cfg.GRP_BY_SES_SPK, key, j):
                     results[f][(ses_type, ses_id, 0, spk_id)] = \
-                        __syn_test(df_grp_ses_spk, f)
-            for tsk_id, df_grp_ses_tsk in df_grp_ses_f.groupby('tsk_id'):
+                        __syn_result(grp_stats[cfg.GRP_BY_SES_SPK], key, j)
+            for tsk_id in ses_tsks[ses_id]:
+                key = (ses_type, ses_id, tsk_id)
+                if not has_vals(cfg.GRP_BY_TSK, key, j):
+                    continue
                 # result per task, symmetric measure for both speakers
                 if cfg.GRP_BY_TSK in grp_by:
                     results[f][(ses_type, ses_id, tsk_id, 0)] = \
-                        __syn_test(df_grp_ses_tsk, f)
-                for spk_id, df_grp_ses_tsk_spk \
-                in df_grp_ses_tsk.groupby('spk_id'):
+                        __syn_result(grp_stats[cfg.GRP_BY_TSK], key, j)
+                for spk_id in tsk_spks[(ses_id, tsk_id)]:
+                    key = (ses_type, ses_id, tsk_id, spk_id)
                     # result per task, asymmetric measure per speaker
-                    if cfg.GRP_BY_TSK_SPK in grp_by:
+                    if cfg.GRP_BY_TSK_SPK in grp_by \
+                    and has_vals(cfg.GRP_BY_TSK_SPK, key, j):
                         results[f][(ses_type, ses_id, tsk_id, spk_id)] = \
-                            __syn_test(df_grp_ses_tsk_spk, f)
+                            __syn_result(
+                                grp_stats[cfg.GRP_BY_TSK_SPK], key, j)
     return aux.get_df(results, ['ses_type', 'ses_id', 'tsk_id', 'spk_id'])
 
 
@@ -281,37 +524,57 @@ def lcon(df_bt, grp_by=[cfg.GRP_BY_SES, cfg.GRP_BY_SES_SPK]):
         indexed by session type, ses_id, and spk_id
         (0 for spk_id index means both speakers in that session)
     '''
-    def __lcon_test(df, f):
-        if len(df) < 2 or np.std(df[f + '_sim']) == 0:
+    def __lcon_result(grp_stats, key, j):
+        ''' returns result tuple for given group and feature '''
+        grp_idx, stats = grp_stats
+        i = grp_idx[key]
+        n = int(stats['n'][i, j])
+        if n < 2 or stats['x_std0'][i, j]:
             # exclude arrays that are too short or constant (pearsonr undefined)
-            return (np.nan, np.nan, len(df)-2, np.nan)
-        else:
-            # compute correlation between similarity and turn-initial start time
-            return scipy.stats.pearsonr(df[f + '_sim'], df['start_time']) \
-                + (len(df)-2,)
-            # _run_permutation_check(df[f + '_sim'], df['start_time'])
-            # removed because permutation check no longer deemed necessary 
+            return (np.nan, np.nan, n-2, np.nan)
+        # correlation between similarity and turn-initial start time
+        return (stats['r'][i, j], stats['p'][i, j], n-2)
+        # (for permutation p-values and bootstrap intervals see resample.py)
     assert len(grp_by) > 0, 'at least one grp_by value needed'
     supported = [cfg.GRP_BY_SES, cfg.GRP_BY_SES_SPK]
     for g in grp_by:
         assert g in cfg.GRP_BYS, 'unknown grp_by value found'
         assert g in supported, 'unsupported grp_by value found'
     # note: correlating with turn_index_ses makes very little difference
+    df_p = df_bt[df_bt['p_or_x'] == 'p']
+    x = df_p.loc[:, [f + '_sim' for f in cfg.FEATURES]].to_numpy(
+        dtype=float, copy=True)
+    # rows with nan (NULL) values are excluded for the respective feature and
+    # all subsequent ones (cumulative filter, as in the original loop)
+    x[np.cumsum(np.isnan(x), axis=1) > 0] = np.nan
+    y = np.repeat(df_p['start_time'].to_numpy(dtype=float)[:, None], 
+                  x.shape[1], axis=1)
+    grp_stats = {}
+    for g, cols in [(cfg.GRP_BY_SES, []), (cfg.GRP_BY_SES_SPK, ['spk_id'])]:
+        codes, grp_idx = _get_grp_codes(
+            [df_p[c].to_numpy() for c in ['ses_type', 'ses_id'] + cols])
+        grp_stats[g] = \
+            (grp_idx, _get_pearsons(codes, len(grp_idx), x, y))
+    ses_spks = {}
+    for ses_type, ses_id, spk_id in grp_stats[cfg.GRP_BY_SES_SPK][0]:
+        ses_spks.setdefault(ses_id, []).append(spk_id)
+    has_vals = lambda g, key, j: \
+        grp_stats[g][1]['n'][grp_stats[g][0][key], j] > 0
     results = {f: {} for f in cfg.FEATURES}
-    for (ses_type, ses_id), df_grp_ses \
-    in df_bt[df_bt['p_or_x'] == 'p'].groupby(['ses_type', 'ses_id']):
-        for f in cfg.FEATURES:
-            # exclude nan (NULL) feature values
-            df_grp_ses = df_grp_ses[pd.notna(df_grp_ses[f + '_sim'])]
+    for ses_type, ses_id in grp_stats[cfg.GRP_BY_SES][0]:
+        for j, f in enumerate(cfg.FEATURES):
             # result per session, symmetric measure for both speakers
             if cfg.GRP_BY_SES in grp_by:
-                results[f][(ses_type, ses_id, 0, 0)] = \
-                    __lcon_test(df_grp_ses, f)
-            for spk_id, df_grp_ses_spk in df_grp_ses.groupby('spk_id'):
+                results[f][(ses_type, ses_id, 0, 0)] = __lcon_result(
+                    grp_stats[cfg.GRP_BY_SES], (ses_type, ses_id), j)
+            for spk_id in ses_spks[ses_id]:
+                key = (ses_type, ses_id, spk_id)
                 # result per session, asymmetric measure per speaker
-                if cfg.GRP_BY_SES_SPK in grp_by:
+                # (only speakers with non-nan feature values)
+                if cfg.GRP_BY_SES_SPK in grp_by \
+                and has_vals(cfg.GRP_BY_SES_SPK, key, j):
                     results[f][(ses_type, ses_id, 0, spk_id)] = \
-                        __lcon_test(df_grp_ses_spk, f)
+                        __lcon_result(grp_stats[cfg.GRP_BY_SES_SPK], key, j)
     # note: convergence per task is not computed, tsk_id is always 0;
     #       only included for consistent interface for all local measures
     return aux.get_df(results, ['ses_type', 'ses_id', 'tsk_id', 'spk_id'])
@@ -1,15 +1,19 @@
 from datetime import datetime
 from datetime import timedelta
+import functools
 import hyphenate
-import nltk
+import os
 import pandas as pd
+import pickle
 
 import cfg
 
-cmu_dict = nltk.corpus.cmudict.dict()
-
 # this module contains some auxiliary functions used throughout other modules
 
+# syllable counts per word from cmudict (primary pronunciation), loaded on
+# first use (see _get_syl_counts)
+_syl_counts = None
+
 
 
 def round_ts(ts):
@@ -28,10 +32,31 @@ def get_ts_offset(ts_start, line):
     return round_ts((get_ts(line) - ts_start) / timedelta(seconds=1))
 
 
+def get_ts_us(line):
+    ''' returns timestamp of log line in microseconds since midnight
+
+    same as get_ts (for cfg.TS_FMT, i.e., "%H:%M:%S:%f") but parsed with plain
+    integer arithmetic, which is much faster than strptime for large logs
+    '''
+    h, m, s, f = line.split('\t', 1)[0].split(':')
+    # fraction is right-padded to microseconds, as for %f
+    return ((int(h) * 60 + int(m)) * 60 + int(s)) * 1000000 \
+        + int(f) * 10 ** (6 - len(f))
+
+
+def get_ts_us_offset(us_start, line):
+    ''' same as get_ts_offset, for start time as returned by get_ts_us '''
+    return round_ts((get_ts_us(line) - us_start) / 1000000)
+
+
 def get_spk_id(grp_id, mch_id):
     return (4 * (grp_id-1) + mch_id) if mch_id != 'W' else 0
 
 
+def get_mch_id(grp_id, spk_id):
+    return (spk_id - 4 * (grp_id-1)) if spk_id != 0 else 0
+
+
 def get_ses_id(grp_id, rnd, pair):
     return 14 * (grp_id-1) + 2 * (rnd-1) + pair
 
@@ -45,44 +70,75 @@ def is_first_game_round(grp_id, rnd):
         or (not has_games_first(grp_id) and rnd==3)
 
 
+def _get_syl_counts():
+    ''' returns syllable counts by word, loading them on first use
+
+    the counts are precompiled from cmudict into a pickle file the first time
+    (delete it to rebuild), so nltk and the full dictionary are only needed
+    once rather than on every import
+    '''
+    global _syl_counts
+    if _syl_counts is None:
+        pfn = cfg.CACHE_PATH + cfg.SYL_COUNTS_FNAME
+        if os.path.exists(pfn):
+            with open(pfn, 'rb') as file:
+                _syl_counts = pickle.load(file)
+        else:
+            import nltk
+            # vowels are recognizable by their stress markers (final digit),
+            # for example:
+            #     cmudict["natural"][0] = ['N', 'AE1', 'CH', 'ER0', 'AH0', 'L']
+            _syl_counts = {
+                word: sum([1 for p in prons[0] if p[-1].isdigit()])
+                for word, prons in nltk.corpus.cmudict.dict().items()}
+            # write to tmp file first, other processes may be reading
+            os.makedirs(cfg.CACHE_PATH, exist_ok=True)
+            tmp_pfn = '%s.%d' % (pfn, os.getpid())
+            with open(tmp_pfn, 'wb') as file:
+                pickle.dump(_syl_counts, file, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_pfn, pfn)
+    return _syl_counts
+
+
+@functools.lru_cache(maxsize=cfg.SYL_CACHE_SIZE)
+def count_word_syllables(word):
+    ''' counts the number of syllables in a single word (memoized) '''
+    syl_counts = _get_syl_counts()
+    ### PREPROCESSING
+    # remove whitespace and convert to lowercase for dictionary lookup
+    word = word.strip().lower()
+    # '-' marks incomplete words; remove it
+    if len(word) > 0 and word[-1] == '-':
+        word = word[:-1]
+    # remove trailing "'s" if word with it is not in dictionary
+    # (does not change syllable count)
+    if len(word) > 1 and word[-2:] == "'s" and word not in syl_counts:
+        word = word[:-2]
+
+    ### SPECIAL CASES
+    # there are no syllables in an empty string
+    if len(word) == 0:
+        return 0
+    # annotators are instructed to transcribe unintelligible speech with one
+    # '?' per syllable (this is the only punctuation they are asked to use)
+    if '?' in word:
+        return word.count('?')
+    # standard method does not work for 'm&m', handle it separately
+    # (word shows up often because it is one of the images in B-MIC)
+    if word in ['m&m', 'm&ms']:
+        return 3
+    ### STANDARD METHOD (dictionary lookup; fallback: automatic hyphenation)
+    if word in syl_counts:
+        # word is in the dictionary, use number of vowels in primary
+        # pronunciation (see _get_syl_counts)
+        return syl_counts[word]
+    # fall back to the hyphenate library for a best guess (imperfect)
+    return len(hyphenate.hyphenate_word(word))
+
+
 def count_syllables(in_str):
     ''' counts the number of syllables in a given string '''
-    syll_count = 0
-    for word in in_str.split(' '):
-        ### PREPROCESSING
-        # remove whitespace and convert to lowercase for dictionary lookup
-        word = word.strip().lower()
-        # '-' marks incomplete words; remove it
-        if len(word) > 0 and word[-1] == '-':
-            word = word[:-1]
-        # remove trailing "'s" if word with it is not in dictionary
-        # (does not change syllable count) 
-        if len(word) > 1 and word[-2:] == "'s" and word not in cmu_dict:
-            word = word[:-2]
-
-        ### SPECIAL CASES
-        # there are no syllables in an empty string
-        if len(word) == 0:
-            syll_count += 0
-        # annotators are instructed to transcribe unintelligible speech with one
-        # '?' per syllable (this is the only punctuation they are asked to use)
-        elif '?' in word:
-            syll_count += sum([1 if c == '?' else 0 for c in word])
-        # standard method does not work for 'm&m', handle it separately
-        # (word shows up often because it is one of the images in B-MIC)
-        elif word in ['m&m', 'm&ms']:
-            syll_count += 3
-        ### STANDARD METHOD (dictionary lookup; fallback: automatic hyphenation)
-        elif word in cmu_dict:
-            # word is in the dictionary, extract number of vowels in primary
-            # pronunciation as syllable count; vowels are recognizable by their 
-            # stress markers (final digit), for example:
-            #     cmu_dict["natural"][0] = ['N', 'AE1', 'CH', 'ER0', 'AH0', 'L']
-            syll_count += sum([1 for p in cmu_dict[word][0] if p[-1].isdigit()])
-        else:
-            # fall back to the hyphenate library for a best guess (imperfect)
-            syll_count += len(hyphenate.hyphenate_word(word))
-    return syll_count
+    return sum([count_word_syllables(word) for word in in_str.split(' ')])
 
 
 def get_df(data, index_names):
@@ -19,6 +19,9 @@ CORPUS_IDS = [CORPUS_ID_BMIC, CORPUS_ID_GC]
 CORPUS_PATH_BMIC = '../../data/'
 TMP_PATH = '../../tmp/'
 
+# directory for cached analysis data (see ap.load_data)
+CACHE_PATH = '../../cache/'
+
 # database filename
 DB_FNAME_BMIC = '../../bmic.db'
 DB_FNAME_GC = '../../gc.db'
@@ -29,6 +32,7 @@ TRANS_FIN_FNAME = 'transcript_final.txt'
 
 # praat and sql scripts
 PRAAT_SCRIPT_FNAME = '../praat/extract_features.praat'
+PRAAT_BATCH_SCRIPT_FNAME = '../praat/extract_features_batch.praat'
 SQL_INIT_FNAME_BMIC = 'init_bmic.sql'
 SQL_QR_FNAME = 'process_question_responses.sql'
 SQL_CU_FNAME = 'cleanup.sql'
@@ -39,6 +43,65 @@ SQL_SP_FNAME_BMIC = 'speaker_pairs_bmic.sql'
 SQL_SP_FNAME_GC = 'speaker_pairs_gc.sql'
 SQL_EXT_FNAME = './libsqlitefunctions'
 
+# feature extraction engine: number of worker processes (None for one per cpu
+# core) and number of chunks written per commit
+FEA_PROCESSES = None
+FEA_COMMIT_SIZE = 500
+
+# feature extraction backends: one praat run per chunk, one praat run for all
+# chunks of a speaker in a session (same feature values, fewer processes), or
+# in-process computation with numpy (no processes at all, approximate values)
+FEA_BACKEND_PRAAT = 'praat'
+FEA_BACKEND_PRAAT_BATCH = 'praat_batch'
+FEA_BACKEND_NUMPY = 'numpy'
+FEA_BACKENDS = [FEA_BACKEND_PRAAT, FEA_BACKEND_PRAAT_BATCH, FEA_BACKEND_NUMPY]
+FEA_BACKEND = FEA_BACKEND_PRAAT_BATCH
+
+# energy-based vad: frame size and step (same as in smile/energy.conf), mean
+# squared amplitude above which a frame counts as sounding, and number of
+# frames per block read at once by the numpy backend (bounds memory use)
+VAD_FRAME_DUR = 0.01
+VAD_SOUND_THRESH = 0.000001
+VAD_BLOCK_FRAMES = 60000
+
+# vad backends: frame energies from opensmile (external process and csv file)
+# or computed in-process with numpy on the memory-mapped wav file
+VAD_BACKEND_SMILE = 'smile'
+VAD_BACKEND_NUMPY = 'numpy'
+VAD_BACKENDS = [VAD_BACKEND_SMILE, VAD_BACKEND_NUMPY]
+VAD_BACKEND = VAD_BACKEND_NUMPY
+
+# number of worker processes for parsing logs of groups (see
+# logs.process_groups), None for one per cpu core
+LOG_PROCESSES = None
+
+# number of worker processes for vad and asr (see vad_asr.do_all), None for one
+# per cpu core (note that asr also sends concurrent requests in each process)
+DO_ALL_PROCESSES = None
+
+# resampling-based significance checks (see resample.py): number of
+# permutations and bootstrap samples, confidence intervals cover 1 - alpha,
+# maximum number of values per batch of resamples (bounds memory use), and
+# number of worker processes (None for one per cpu core)
+RS_N_RESAMPLES = 9999
+RS_ALPHA = 0.05
+RS_BATCH_ELEMS = 2000000
+RS_PROCESSES = None
+
+# chunk pairs (see chp.py): seed for sampling non-adjacent pairs (each session
+# gets its own random stream derived from it, so samples do not depend on
+# others)
+CHP_SEED = 20200101
+
+# maximum number of memory-mapped wav files kept open (see wav.py)
+WAV_CACHE_SIZE = 32
+
+# syllable counting (see aux.count_syllables): file (in CACHE_PATH) with
+# syllable counts per word precompiled from cmudict, and number of words for
+# which counts are memoized in each process
+SYL_COUNTS_FNAME = 'cmudict_syllables.pkl'
+SYL_CACHE_SIZE = 65536
+
 # format of timestamps in log files
 TS_FMT = '%H:%M:%S:%f'
 
@@ -87,6 +150,22 @@ FEATURES_ALL = [
     'rate_syl',
     'rate_vcd'
 ]
+# keys of the features per db column, as output by the extraction backends
+FEATURE_KEYS = {
+    'intensity_mean': 'int_mean',
+    'intensity_std': 'int_std',
+    'intensity_min': 'int_min',
+    'intensity_max': 'int_max',
+    'pitch_mean': 'f0_mean',
+    'pitch_std': 'f0_std',
+    'pitch_min': 'f0_min',
+    'pitch_max': 'f0_max',
+    'jitter': 'jitter',
+    'shimmer': 'shimmer',
+    'nhr': 'nhr',
+    'rate_syl': 'rate_syl',
+    'rate_vcd': 'vcd2tot_frames'
+}
 FEATURES = [
     'intensity_mean',
     'intensity_max',
@@ -107,6 +186,14 @@ def check_mea_id(mea_id):
     assert mea_id in MEASURES, 'unknown entrainment measure'
 
 
+def check_fea_backend(backend):
+    assert backend in FEA_BACKENDS, 'unknown feature extraction backend'
+
+
+def check_vad_backend(backend):
+    assert backend in VAD_BACKENDS, 'unknown vad backend'
+
+
 def get_db_fname(corpus_id):
     check_corpus_id(corpus_id)
     return DB_FNAME_GC if corpus_id == CORPUS_ID_GC else DB_FNAME_BMIC
@@ -133,3 +220,11 @@ API_KEY = ''
 API_INS = ''
 API_URL = 'https://api.us-south.speech-to-text.watson.cloud.ibm.com/'
 
+
+# asr dispatcher (see rec.py): maximum number of concurrent requests, number of
+# retries per request after failures worth retrying, initial delay between
+# attempts (in seconds, doubled after each retry), and timeout per request
+ASR_MAX_WORKERS = 8
+ASR_RETRIES = 3
+ASR_BACKOFF = 1.0
+ASR_TIMEOUT = 120
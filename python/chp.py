@@ -0,0 +1,162 @@
+import math
+import numpy as np
+
+import cfg
+import db
+
+# this module builds the chunk_pairs table for local entrainment measures;
+# adjacent pairs ('p') are computed by sql/aux_tables.sql, non-adjacent pairs
+# ('x') are sampled here from the adjacent ones with a seeded random number
+# generator, drawing only the required number of partners per turn-initial
+# chunk instead of sorting all possible choices randomly; pairs can be built
+# for the whole corpus or updated only for sessions whose chunks changed
+
+
+
+################################################################################
+#                        NON-PUBLIC AUXILIARY FUNCTIONS                        #
+################################################################################
+
+def _load_p_pairs():
+    ''' loads adjacent pairs of selected sessions (see db.set_chp_sessions)
+
+    returns:
+        pandas dataframe with chunk ids, session, speaker and role of chunk 1
+    '''
+    sql_stmt = \
+        'SELECT chp.chu_id1,\n' \
+        '       chp.chu_id2,\n' \
+        '       chp.ses_id,\n' \
+        '       tur1.spk_id spk_id1,\n' \
+        '       tur1.speaker_role speaker_role1\n' \
+        'FROM   chunk_pairs chp\n' \
+        'JOIN   chunks chu1\n' \
+        'ON     chp.chu_id1 == chu1.chu_id\n' \
+        'JOIN   turns tur1\n' \
+        'ON     chu1.tur_id == tur1.tur_id\n' \
+        'WHERE  chp.p_or_x == "p"\n' \
+        'AND    chp.ses_id IN (SELECT ses_id FROM chp_sessions)\n' \
+        'ORDER BY chp.ses_id, chp.chu_id2, chp.chu_id1;'
+    return db.pd_read_sql_query(sql_stmt)
+
+
+def _sample_x_pairs(df_ses, rng):
+    ''' samples non-adjacent pairs for all turn-initial chunks of a session
+
+    possible choices for a turn-initial chunk are those turn-final or almost
+    turn-final chunks by the same speaker in the same role as its adjacent
+    chunk, which are adjacent or almost adjacent to some other turn-initial
+    chunk (once per adjacent pair of the turn-initial chunk, as before); at
+    least 10 and at least 25 percent of them are chosen, in random order
+
+    args:
+        df_ses: pandas dataframe with adjacent pairs of one session as loaded
+            by _load_p_pairs (sorted by chu_id2)
+        rng: numpy random number generator
+    returns:
+        list of ('x', ses_id, chu_id1, chu_id2, rid) tuples, rid is the
+        position of the pair in the random order (starting at 0)
+    '''
+    # choices per speaker and role, sorted by chu_id2 so that the pairs of any
+    # turn-initial chunk (which are excluded for it) form one slice
+    ses_id = int(df_ses['ses_id'].iloc[0])
+    choices = {}
+    for key, df_grp in df_ses.groupby(['spk_id1', 'speaker_role1']):
+        choices[key] = (df_grp['chu_id1'].to_numpy(),
+                        df_grp['chu_id2'].to_numpy())
+    chps = []
+    for chu_id2, df_chu in df_ses.groupby('chu_id2'):
+        cands = []
+        for key in zip(df_chu['spk_id1'], df_chu['speaker_role1']):
+            chu_ids1, chu_ids2 = choices[key]
+            lo = np.searchsorted(chu_ids2, chu_id2, 'left')
+            hi = np.searchsorted(chu_ids2, chu_id2, 'right')
+            cands += [chu_ids1[:lo], chu_ids1[hi:]]
+        cands = np.concatenate(cands)
+        if len(cands) == 0:
+            continue
+        n = min(len(cands), math.ceil(max(10, 0.25 * len(cands))))
+        sample = cands[rng.choice(len(cands), n, replace=False)]
+        chps += [('x', ses_id, int(chu_id1), int(chu_id2), rid)
+                 for rid, chu_id1 in enumerate(sample)]
+    return chps
+
+
+def _get_stamps(seed):
+    ''' returns current stamp per session, including the seed '''
+    return {ses_id: '%s;%s' % (seed, stamp)
+            for ses_id, stamp in db.get_chp_input_stamps().items()}
+
+
+def _compute(ses_ids, seed):
+    ''' (re)computes adjacent and non-adjacent pairs for given sessions
+
+    also records the stamps of these sessions (see db.set_chp_stamps)
+
+    returns:
+        number of non-adjacent pairs inserted
+    '''
+    stamps = _get_stamps(seed)
+    db.set_chp_sessions(ses_ids)
+    db.executescript(cfg.SQL_PATH, cfg.SQL_AT_FNAME)
+    seed_seq = np.random.SeedSequence(seed)
+    chps = []
+    for ses_id, df_ses in _load_p_pairs().groupby('ses_id'):
+        rng = np.random.default_rng(np.random.SeedSequence(
+            seed_seq.entropy, spawn_key=(int(ses_id),)))
+        chps += _sample_x_pairs(df_ses, rng)
+    db.ins_chp_bulk(chps)
+    db.set_chp_stamps(ses_ids, stamps)
+    return len(chps)
+
+
+
+################################################################################
+#                               PUBLIC FUNCTIONS                               #
+################################################################################
+
+def build(seed=cfg.CHP_SEED):
+    ''' (re)creates chunk_pairs table for all sessions
+
+    samples are reproducible for a given seed; each session gets its own
+    random stream, so its samples do not depend on other sessions
+
+    args:
+        seed: seed for random number generation (None for fresh entropy)
+    returns:
+        number of non-adjacent pairs inserted
+    '''
+    db.drop_chunk_pairs()
+    return _compute(db.get_ses_ids(), seed)
+
+
+def update(seed=cfg.CHP_SEED):
+    ''' recomputes chunk pairs only for sessions which are not up to date
+
+    a session is up to date if the chunk data its pairs depend on and the
+    seed are the same as when its pairs were computed (compared by stamps,
+    see db.get_chp_input_stamps), so new sessions as well as sessions whose
+    chunks or features changed (e.g., after re-extraction) are recomputed;
+    pairs of all other sessions are kept (including their non-adjacent
+    samples), so the time needed depends on the changed sessions only (apart
+    from computing the stamps); session status is neither used nor changed
+
+    falls back to build if the chunk_pairs table does not exist yet or was
+    created by an older version of aux_tables.sql (without ses_id)
+
+    args:
+        seed: seed for random number generation (use the same as for build,
+            so that results equal those of a full build)
+    returns:
+        number of non-adjacent pairs inserted
+    '''
+    if 'ses_id' not in db.get_columns('chunk_pairs'):
+        return build(seed)
+    stamps = _get_stamps(seed)
+    done = db.get_chp_stamps()
+    # (sessions that no longer have chunks only have their pairs removed)
+    ses_ids = sorted([ses_id for ses_id in set(stamps) | set(done)
+                      if stamps.get(ses_id) != done.get(ses_id)])
+    if len(ses_ids) == 0:
+        return 0
+    return _compute(ses_ids, seed)
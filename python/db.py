@@ -1,3 +1,4 @@
+import contextlib
 import pandas as pd
 import sqlite3
 
@@ -36,6 +37,9 @@ class DatabaseConnection(object):
     def commit(self):
         self._conn.commit()
 
+    def rollback(self):
+        self._conn.rollback()
+
     def get_conn(self):
         return self._conn
 
@@ -43,18 +47,46 @@ class DatabaseConnection(object):
 # all functions interacting with database (setters etc.) assume open connection
 dbc = None
 
+# rows buffered by ins_* functions while a batch is active (see begin_batch),
+# as (sql_stmt, rows) tuple per table; None if no batch is active
+_batch = None
+
+# order in which buffered rows are written (referenced tables first, so that
+# inserts which look up other tables find the rows of the same batch)
+_BATCH_TABLES = ['groups', 'speakers', 'sessions', 'tasks',
+                 'question_responses', 'turns', 'chunks']
+
 
 def connect(corpus_id):
     ''' instantiates global connection object for given corpus '''
     global dbc
     dbc = DatabaseConnection(cfg.get_db_fname(corpus_id))
+    if corpus_id == cfg.CORPUS_ID_BMIC:
+        migrate()
+
+
+def migrate():
+    ''' updates schema of databases created by an older init_bmic.sql
+
+    adds and fills the redundant speaker columns of turns (a_or_b, spk_id);
+    does nothing for up-to-date databases (called by connect)
+    '''
+    cols = get_columns('turns')
+    if len(cols) > 0 and 'spk_id' not in cols:
+        dbc.execute('ALTER TABLE turns ADD COLUMN a_or_b TEXT;')
+        dbc.execute('ALTER TABLE turns ADD COLUMN spk_id INTEGER '
+                    'REFERENCES speakers (spk_id);')
+        dbc.execute('CREATE INDEX tur_spk_fk ON turns (spk_id);')
+        set_tur_speakers()
+        dbc.commit()
 
 
 def close():
     ''' closes connection by deleting global connection object '''
-    global dbc
+    global dbc, _batch
     del dbc
     dbc = None
+    _batch = None
 
 
 def commit():
@@ -62,6 +94,11 @@ def commit():
     dbc.commit()
 
 
+def rollback():
+    ''' discards all changes since the last commit '''
+    dbc.rollback()
+
+
 def get_conn():
     ''' returns internal sqlite3 connection of global connection object 
 
@@ -73,19 +110,89 @@ def get_conn():
 ################################################################################
 #                                  INSERTIONS                                  #
 ################################################################################
+# all ins_* functions insert a single row right away, unless a batch is active
+# (see batch and begin_batch), in which case the row is only buffered
+
+def _insert(table, sql_stmt, params):
+    ''' executes insert statement, or buffers its row if a batch is active '''
+    if _batch is None:
+        dbc.execute(sql_stmt, params)
+    else:
+        _batch.setdefault(table, (sql_stmt, []))[1].append(params)
+
+
+def begin_batch():
+    ''' starts buffering rows of all ins_* functions (until end_batch)
+
+    buffered rows are not visible to queries before end_batch; foreign key
+    checks (if enabled) are deferred until the transaction is committed; see
+    batch for a with statement that also aborts the batch on errors
+    '''
+    global _batch
+    assert _batch is None, 'batch already active'
+    _batch = {}
+    dbc.execute('PRAGMA defer_foreign_keys = ON;')
+
+
+def end_batch():
+    ''' writes all rows buffered since begin_batch, one executemany per table
+
+    tables are written in a fixed order (see _BATCH_TABLES), rows of each
+    table in order of insertion (so autoincrement ids are the same as without
+    batch); all rows are part of the current transaction (until next commit)
+
+    returns:
+        number of rows written
+    '''
+    global _batch
+    batch, _batch = _batch, None
+    assert batch is not None, 'no batch active'
+    for table in sorted(batch, key=_BATCH_TABLES.index):
+        dbc.executemany(*batch[table])
+    return sum([len(rows) for _, rows in batch.values()])
+
+
+def abort_batch():
+    ''' discards all rows buffered since begin_batch and rolls back
+
+    (rolls back the current transaction, i.e., all changes since the last
+    commit, including rows of the batch already written by end_batch)
+    '''
+    global _batch
+    _batch = None
+    rollback()
+
+
+@contextlib.contextmanager
+def batch():
+    ''' buffers rows of all ins_* functions within a with statement
+
+    usage: "with db.batch(): ..."; rows are written at the end of the block
+    (see begin_batch and end_batch); if the block (or writing the rows) fails,
+    the batch is aborted instead (see abort_batch) and the exception re-raised,
+    so no later ins_* call is left buffering
+    '''
+    begin_batch()
+    try:
+        yield
+        end_batch()
+    except BaseException:
+        abort_batch()
+        raise
+
 
 def ins_grp(grp_id, sex_seq, cfg_seq, games_first):
     sql_stmt = \
         'INSERT INTO groups (grp_id, sex_seq, cfg_seq, games_first)\n' \
         'VALUES(?,?,?,?);'
-    dbc.execute(sql_stmt, (grp_id, sex_seq, cfg_seq, games_first))
+    _insert('groups', sql_stmt, (grp_id, sex_seq, cfg_seq, games_first))
 
 
 def ins_spk(spk_id, mch_id):
     sql_stmt = \
         'INSERT INTO speakers (spk_id, subject_index)\n' \
         'VALUES (?,?);'
-    dbc.execute(sql_stmt, (spk_id, mch_id))
+    _insert('speakers', sql_stmt, (spk_id, mch_id))
 
 
 def ins_ses(ses_id, grp_id, spk_id_a, spk_id_b, rnd, ses_type, cfg):
@@ -94,28 +201,62 @@ def ins_ses(ses_id, grp_id, spk_id_a, spk_id_b, rnd, ses_type, cfg):
                               'type, cfg)\n' \
         'VALUES (?,?,?,?,?,?,?);'
     params = (ses_id, grp_id, spk_id_a, spk_id_b, rnd, ses_type, cfg)
-    dbc.execute(sql_stmt, params)
+    _insert('sessions', sql_stmt, params)
 
 
 def ins_tsk(ses_id, task_index, a_or_b):
     sql_stmt = \
         'INSERT INTO tasks (ses_id, task_index, a_or_b)\n' \
         'VALUES (?,?,?);'
-    dbc.execute(sql_stmt, (ses_id, task_index, a_or_b))
+    _insert('tasks', sql_stmt, (ses_id, task_index, a_or_b))
 
 
 def ins_qre(que_id, spk_id, val, ts):
     sql_stmt = \
         'INSERT INTO question_responses (que_id, spk_id, val, ts)\n' \
         'VALUES (?,?,?,?);'
-    dbc.execute(sql_stmt, (que_id, spk_id, val, ts))
+    _insert('question_responses', sql_stmt, (que_id, spk_id, val, ts))
 
 
 def ins_tur(tur_id, tsk_id, turn_index_ses, speaker_role):
+    # speaker columns are looked up from task and session in the same
+    # statement (same values as set by set_tur_speakers)
     sql_stmt = \
-        'INSERT INTO turns (tur_id, tsk_id, turn_index_ses, speaker_role)\n' \
-        'VALUES (?,?,?,?);'
-    dbc.execute(sql_stmt, (tur_id, tsk_id, turn_index_ses, speaker_role))
+        'WITH tur AS (\n' \
+        '    SELECT ? tur_id, ? tsk_id, ? turn_index_ses, ? speaker_role\n' \
+        ')\n' \
+        'INSERT INTO turns (tur_id, tsk_id, turn_index_ses, speaker_role, ' \
+                           'a_or_b, spk_id)\n' \
+        'SELECT tur.tur_id,\n' \
+        '       tur.tsk_id,\n' \
+        '       tur.turn_index_ses,\n' \
+        '       tur.speaker_role,\n' \
+        '       CASE\n' \
+        '           WHEN tsk.tsk_id IS NULL\n' \
+        '           THEN NULL\n' \
+        '           WHEN tur.speaker_role == "d"\n' \
+        '           AND  tsk.a_or_b == "A"\n' \
+        '           THEN "A"\n' \
+        '           WHEN tur.speaker_role == "f"\n' \
+        '           AND  tsk.a_or_b == "B"\n' \
+        '           THEN "A"\n' \
+        '           ELSE "B"\n' \
+        '       END,\n' \
+        '       CASE\n' \
+        '           WHEN tur.speaker_role == "d"\n' \
+        '           AND  tsk.a_or_b == "A"\n' \
+        '           THEN ses.spk_id_a\n' \
+        '           WHEN tur.speaker_role == "f"\n' \
+        '           AND  tsk.a_or_b == "B"\n' \
+        '           THEN ses.spk_id_a\n' \
+        '           ELSE ses.spk_id_b\n' \
+        '       END\n' \
+        'FROM   tur\n' \
+        'LEFT JOIN tasks tsk\n' \
+        'ON     tur.tsk_id == tsk.tsk_id\n' \
+        'LEFT JOIN sessions ses\n' \
+        'ON     tsk.ses_id == ses.ses_id;'
+    _insert('turns', sql_stmt, (tur_id, tsk_id, turn_index_ses, speaker_role))
 
 
 def ins_chu(chu_id, tur_id, chunk_index, start_time, end_time, words):
@@ -124,7 +265,19 @@ def ins_chu(chu_id, tur_id, chunk_index, start_time, end_time, words):
                             'end_time, words)\n' \
         'VALUES (?,?,?,?,?,?);'
     params = (chu_id, tur_id, chunk_index, start_time, end_time, words)
-    dbc.execute(sql_stmt, params)
+    _insert('chunks', sql_stmt, params)
+
+
+def ins_chp_bulk(chps):
+    ''' inserts many chunk pairs with a single executemany
+
+    args:
+        chps: iterable of (p_or_x, ses_id, chu_id1, chu_id2, rid) tuples
+    '''
+    sql_stmt = \
+        'INSERT INTO chunk_pairs (p_or_x, ses_id, chu_id1, chu_id2, rid)\n' \
+        'VALUES (?,?,?,?,?);'
+    dbc.executemany(sql_stmt, chps)
 
 
 
@@ -201,8 +354,70 @@ def set_turn_indices():
     dbc.execute(sql_stmt)
 
 
+def set_tur_speakers(tur_id=None):
+    ''' sets redundant speaker columns (a_or_b, spk_id) of turns
+
+    ins_tur sets them already; this is only needed after changes to tasks or
+    sessions, or for turns inserted before the columns existed (see migrate)
+
+    args:
+        tur_id: id of turn to update, None for all turns
+    '''
+    sql_stmt = \
+        'UPDATE turns\n' \
+        'SET    a_or_b = (\n' \
+        '           SELECT CASE\n' \
+        '                      WHEN turns.speaker_role == "d"\n' \
+        '                      AND  tsk.a_or_b == "A"\n' \
+        '                      THEN "A"\n' \
+        '                      WHEN turns.speaker_role == "f"\n' \
+        '                      AND  tsk.a_or_b == "B"\n' \
+        '                      THEN "A"\n' \
+        '                      ELSE "B"\n' \
+        '                  END\n' \
+        '           FROM   tasks tsk\n' \
+        '           WHERE  tsk.tsk_id == turns.tsk_id\n' \
+        '       ),\n' \
+        '       spk_id = (\n' \
+        '           SELECT CASE\n' \
+        '                      WHEN turns.speaker_role == "d"\n' \
+        '                      AND  tsk.a_or_b == "A"\n' \
+        '                      THEN ses.spk_id_a\n' \
+        '                      WHEN turns.speaker_role == "f"\n' \
+        '                      AND  tsk.a_or_b == "B"\n' \
+        '                      THEN ses.spk_id_a\n' \
+        '                      ELSE ses.spk_id_b\n' \
+        '                  END\n' \
+        '           FROM   tasks tsk\n' \
+        '           JOIN   sessions ses\n' \
+        '           ON     tsk.ses_id == ses.ses_id\n' \
+        '           WHERE  tsk.tsk_id == turns.tsk_id\n' \
+        '       )'
+    if tur_id is None:
+        dbc.execute(sql_stmt + ';')
+    else:
+        dbc.execute(sql_stmt + '\nWHERE  tur_id == ?;', (tur_id,))
+
+
 def set_features(chu_id, features):
     ''' sets features of given chunk '''
+    set_features_bulk([(chu_id, features)])
+
+
+def set_features_bulk(features):
+    ''' sets features of many chunks with a single executemany
+
+    all updates are part of the same transaction (until the next commit)
+
+    args:
+        features: iterable of (chu_id, features) tuples with features as
+            dictionaries of values by feature key (see cfg.FEATURE_KEYS), or
+            pandas dataframe indexed by chu_id with one column per feature key
+            (missing values as None or nan)
+    '''
+    if isinstance(features, pd.DataFrame):
+        features = features.astype(object).where(pd.notna(features), None)
+        features = zip(features.index, features.to_dict('records'))
     sql_stmt = \
         'UPDATE chunks\n' \
         'SET    pitch_min = ?,\n' \
@@ -219,22 +434,37 @@ def set_features(chu_id, features):
         '       shimmer = ?,\n' \
         '       nhr = ?\n' \
         'WHERE  chu_id == ?;'
-    dbc.execute(sql_stmt, 
-                (features['f0_min'],
-                 features['f0_max'],
-                 features['f0_mean'],
-                 features['f0_std'],
-                 features['rate_syl'],
-                 features['vcd2tot_frames'],
-                 features['int_min'],
-                 features['int_max'],
-                 features['int_mean'],
-                 features['int_std'],
-                 features['jitter'],
-                 features['shimmer'],
-                 features['nhr'],
-                 chu_id))
-        
+    dbc.executemany(sql_stmt, 
+                    ((f['f0_min'],
+                      f['f0_max'],
+                      f['f0_mean'],
+                      f['f0_std'],
+                      f['rate_syl'],
+                      f['vcd2tot_frames'],
+                      f['int_min'],
+                      f['int_max'],
+                      f['int_mean'],
+                      f['int_std'],
+                      f['jitter'],
+                      f['shimmer'],
+                      f['nhr'],
+                      int(chu_id))
+                     for chu_id, f in features))
+
+
+def set_rate_syl_bulk(rates):
+    ''' sets syllable rate of many chunks with a single executemany
+
+    args:
+        rates: iterable of (chu_id, rate_syl) tuples (rate_syl may be None)
+    '''
+    sql_stmt = \
+        'UPDATE chunks\n' \
+        'SET    rate_syl = ?\n' \
+        'WHERE  chu_id == ?;'
+    dbc.executemany(sql_stmt, ((rate_syl, int(chu_id))
+                               for chu_id, rate_syl in rates))
+
 
 
 ################################################################################
@@ -318,17 +548,22 @@ def get_que_id(qai_id, seq):
     return dbc.execute(sql_stmt, (qai_id, seq)).fetchall()[0][0]
 
 
+def get_que_ids():
+    ''' returns que_id of all questions by (qai_id, seq) (see get_que_id) '''
+    sql_stmt = \
+        'SELECT qai_id,\n' \
+        '       seq,\n' \
+        '       que_id\n' \
+        'FROM   questions;'
+    return {(qai_id, seq): que_id
+            for qai_id, seq, que_id in dbc.execute(sql_stmt).fetchall()}
+
+
 def get_tur_duration(ses_id, turn_index_ses):
     ''' returns total duration of turn with given index within given session '''
     sql_stmt = \
         'SELECT SUM(chu.end_time - chu.start_time),\n' \
-        '       CASE\n' \
-        '           WHEN tur.speaker_role == "d" AND tsk.a_or_b == "A"\n' \
-        '           THEN "A"\n' \
-        '           WHEN tur.speaker_role == "f" AND tsk.a_or_b == "B"\n' \
-        '           THEN "A"\n' \
-        '           ELSE "B"\n' \
-        '       END\n' \
+        '       tur.a_or_b\n' \
         'FROM   chunks chu\n' \
         'JOIN   turns tur\n' \
         'ON     chu.tur_id == tur.tur_id\n' \
@@ -363,29 +598,27 @@ def get_tur_id(ses_id, turn_index_ses):
     return dbc.execute(sql_stmt, (ses_id, turn_index_ses)).fetchall()[0][0]
 
 
+def get_tur_ids(ses_id):
+    ''' returns dictionary of tur_id by turn_index_ses for given session '''
+    sql_stmt = \
+        'SELECT tur.turn_index_ses,\n' \
+        '       tur.tur_id\n' \
+        'FROM   turns tur\n' \
+        'JOIN   tasks tsk\n' \
+        'ON     tur.tsk_id == tsk.tsk_id\n' \
+        'WHERE  tsk.ses_id == ?;'
+    return dict(dbc.execute(sql_stmt, (ses_id,)).fetchall())
+
+
 def get_tur_spk(ses_id, turn_index):
     ''' identifies speaker of turn with given index in given session '''
     sql_stmt = \
-        'SELECT CASE\n' \
-        '           WHEN tur.speaker_role == "d" AND tsk.a_or_b == "A"\n' \
-        '           THEN "A"\n' \
-        '           WHEN tur.speaker_role == "f" AND tsk.a_or_b == "B"\n' \
-        '           THEN "A"\n' \
-        '           ELSE "B"\n' \
-        '       END,\n' \
-        '       CASE\n' \
-        '           WHEN tur.speaker_role == "d" AND tsk.a_or_b == "A"\n' \
-        '           THEN ses.spk_id_a\n' \
-        '           WHEN tur.speaker_role == "f" AND tsk.a_or_b == "B"\n' \
-        '           THEN ses.spk_id_a\n' \
-        '           ELSE ses.spk_id_b\n' \
-        '       END\n' \
-        'FROM   turns tur \n' \
+        'SELECT tur.a_or_b,\n' \
+        '       tur.spk_id\n' \
+        'FROM   turns tur\n' \
         'JOIN   tasks tsk\n' \
         'ON     tur.tsk_id == tsk.tsk_id\n' \
-        'JOIN   sessions ses\n' \
-        'ON     tsk.ses_id == ses.ses_id\n' \
-        'WHERE  ses.ses_id == ? \n' \
+        'WHERE  tsk.ses_id == ?\n' \
         'AND    tur.turn_index_ses == ?;'
     a_or_b, spk_id = dbc.execute(sql_stmt, (ses_id, turn_index)).fetchall()[0]
     return a_or_b, int(spk_id)
@@ -411,13 +644,7 @@ def get_words(tsk_or_ses, tsk_ses_id):
     assert tsk_or_ses in ['tsk', 'ses'], 'unknown tsk_or_ses value'
     sql_stmt = \
         'SELECT tur.tur_id,\n' \
-        '       CASE\n' \
-        '           WHEN tsk.a_or_b == "A" AND tur.speaker_role == "d"\n' \
-        '           THEN "A"\n' \
-        '           WHEN tsk.a_or_b == "B" AND tur.speaker_role == "f"\n' \
-        '           THEN "A"\n' \
-        '           ELSE "B"\n' \
-        '       END a_or_b,\n' \
+        '       tur.a_or_b,\n' \
         '       chu.words\n' \
         'FROM   chunks chu\n' \
         'JOIN   turns tur\n' \
@@ -445,6 +672,115 @@ def delete_all():
     dbc.execute('DELETE FROM groups;')
 
 
+def drop_chunk_pairs():
+    ''' drops chunk_pairs table and stamps (recreated by aux_tables.sql) '''
+    dbc.execute('DROP TABLE IF EXISTS chunk_pairs;')
+    dbc.execute('DROP TABLE IF EXISTS chunk_pair_stamps;')
+
+
+def set_chp_sessions(ses_ids):
+    ''' sets sessions for which aux_tables.sql computes chunk pairs
+
+    the ids are stored in a temporary table, visible only to this connection
+
+    args:
+        ses_ids: iterable of session ids
+    '''
+    dbc.execute('CREATE TEMP TABLE IF NOT EXISTS chp_sessions (\n'
+                '    ses_id         INTEGER PRIMARY KEY\n'
+                ');')
+    dbc.execute('DELETE FROM chp_sessions;')
+    dbc.executemany('INSERT INTO chp_sessions (ses_id) VALUES (?);',
+                    ((int(ses_id),) for ses_id in ses_ids))
+
+
+def get_columns(table):
+    ''' returns column names of given table (empty if it does not exist) '''
+    return [row[1] for row in
+            dbc.execute('PRAGMA table_info(%s);' % table).fetchall()]
+
+
+def get_chp_input_stamps():
+    ''' returns stamp per session of the chunk data its chunk pairs depend on
+
+    the stamp is a checksum over ids, indices, timestamps, speakers, and roles
+    of all chunks of the session (and their turns and tasks), and over which
+    of them have all features; it changes whenever the chunk pairs of the
+    session may change, e.g., when chunks are added or features re-extracted
+
+    returns:
+        dictionary with stamp (str) by ses_id, for all sessions with chunks
+    '''
+    sql_stmt = \
+        'SELECT tsk.ses_id,\n' \
+        '       COUNT(*),\n' \
+        '       SUM(chu.chu_id),\n' \
+        '       SUM(chu.chu_id * chu.chunk_index),\n' \
+        '       SUM(chu.chu_id * tur.tur_id),\n' \
+        '       SUM(chu.chu_id * IFNULL(tur.turn_index, 0)),\n' \
+        '       SUM(chu.chu_id * tsk.task_index),\n' \
+        '       SUM(chu.chu_id * IFNULL(tur.spk_id, -1)),\n' \
+        '       SUM(chu.chu_id * (tur.speaker_role == "d")),\n' \
+        '       SUM(chu.chu_id * CAST(ROUND(chu.start_time * 1000) ' \
+                                    'AS INTEGER)),\n' \
+        '       SUM(chu.chu_id * CAST(ROUND(chu.end_time * 1000) ' \
+                                    'AS INTEGER)),\n' \
+        '       SUM(CASE\n' \
+        '               WHEN chu.pitch_min IS NOT NULL\n' \
+        '               AND  chu.pitch_max IS NOT NULL\n' \
+        '               AND  chu.pitch_mean IS NOT NULL\n' \
+        '               AND  chu.pitch_std IS NOT NULL\n' \
+        '               AND  chu.intensity_min IS NOT NULL\n' \
+        '               AND  chu.intensity_max IS NOT NULL\n' \
+        '               AND  chu.intensity_mean IS NOT NULL\n' \
+        '               AND  chu.intensity_std IS NOT NULL\n' \
+        '               AND  chu.rate_vcd IS NOT NULL\n' \
+        '               AND  chu.rate_syl IS NOT NULL\n' \
+        '               AND  chu.jitter IS NOT NULL\n' \
+        '               AND  chu.shimmer IS NOT NULL\n' \
+        '               AND  chu.nhr IS NOT NULL\n' \
+        '               THEN chu.chu_id\n' \
+        '               ELSE 0\n' \
+        '           END)\n' \
+        'FROM   chunks chu\n' \
+        'JOIN   turns tur\n' \
+        'ON     chu.tur_id == tur.tur_id\n' \
+        'JOIN   tasks tsk\n' \
+        'ON     tur.tsk_id == tsk.tsk_id\n' \
+        'GROUP BY tsk.ses_id;'
+    return {int(row[0]): ','.join([str(v) for v in row[1:]])
+            for row in dbc.execute(sql_stmt).fetchall()}
+
+
+def get_chp_stamps():
+    ''' returns stamps recorded when chunk pairs were computed, by ses_id '''
+    if len(get_columns('chunk_pair_stamps')) == 0:
+        return {}
+    sql_stmt = \
+        'SELECT ses_id,\n' \
+        '       stamp\n' \
+        'FROM   chunk_pair_stamps;'
+    return {int(ses_id): stamp
+            for ses_id, stamp in dbc.execute(sql_stmt).fetchall()}
+
+
+def set_chp_stamps(ses_ids, stamps):
+    ''' records stamps of sessions whose chunk pairs were (re)computed
+
+    args:
+        ses_ids: iterable of sessions whose chunk pairs were (re)computed
+        stamps: dictionary with stamp by ses_id; sessions in ses_ids without
+            stamp (i.e., without chunks) are removed
+    '''
+    ses_ids = [int(ses_id) for ses_id in ses_ids]
+    dbc.executemany('DELETE FROM chunk_pair_stamps WHERE ses_id == ?;',
+                    [(ses_id,) for ses_id in ses_ids])
+    dbc.executemany('INSERT INTO chunk_pair_stamps (ses_id, stamp)\n'
+                    'VALUES (?,?);',
+                    [(ses_id, stamps[ses_id]) for ses_id in ses_ids
+                     if ses_id in stamps])
+
+
 def executescript(path, fname):
     ''' executes given file as script '''
     # users should obviously not have the ability to execute arbitrary scripts,  
@@ -483,18 +819,51 @@ def find_chunks(ses_id, a_or_b):
         'JOIN   tasks tsk\n' \
         'ON     tur.tsk_id == tsk.tsk_id\n' \
         'WHERE  tsk.ses_id == ?\n' \
-        'AND    CASE\n' \
-        '           WHEN tur.speaker_role == "d" AND tsk.a_or_b == "A"\n' \
-        '           THEN "A"\n' \
-        '           WHEN tur.speaker_role == "f" AND tsk.a_or_b == "B"\n' \
-        '           THEN "A"\n' \
-        '           ELSE "B"\n' \
-        '       END == ?\n'
+        'AND    tur.a_or_b == ?\n'
     res = dbc.execute(sql_stmt, (ses_id, a_or_b)).fetchall()
     for chu_id, words, start, end in res:
         yield(chu_id, words, start, end)
 
 
+def get_chu_words(status, op='=='):
+    ''' returns all chunks of sessions with certain status, in one query
+
+    returns:
+        list of (chu_id, words, start_time, end_time) tuples
+    '''
+    op = op if op in ['==', '>=', '<=', '>', '<', '!='] else '=='
+    sql_stmt = \
+        'SELECT chu.chu_id,\n' \
+        '       chu.words,\n' \
+        '       chu.start_time,\n' \
+        '       chu.end_time\n' \
+        'FROM   chunks chu\n' \
+        'JOIN   turns tur\n' \
+        'ON     chu.tur_id == tur.tur_id\n' \
+        'JOIN   tasks tsk\n' \
+        'ON     tur.tsk_id == tsk.tsk_id\n' \
+        'JOIN   sessions ses\n' \
+        'ON     tsk.ses_id == ses.ses_id\n' \
+        'WHERE  ses.status ' + op + ' ?\n' \
+        'ORDER BY chu.chu_id;'
+    return dbc.execute(sql_stmt, (status,)).fetchall()
+
+
+def get_chu_ids_with_features():
+    ''' returns set of ids of all chunks with any feature extracted from audio
+
+    (rate_syl is ignored since it is also set from the words alone, see
+    fea.update_rate_syl)
+    '''
+    sql_stmt = \
+        'SELECT chu_id\n' \
+        'FROM   chunks\n' \
+        'WHERE  ' + '\nOR     '.join(
+            ['%s IS NOT NULL' % f for f in cfg.FEATURES_ALL
+             if f != 'rate_syl']) + ';'
+    return set([row[0] for row in dbc.execute(sql_stmt)])
+
+
 def find_sessions(status, op='==', grp_id=None):
     ''' loads meta-data for all sessions with certain status '''
     op = op if op in ['==', '>=', '<=', '>', '<', '!='] else '=='
@@ -530,71 +899,115 @@ def find_sessions(status, op='==', grp_id=None):
                   ((mch_id1, p1, fn1), (mch_id2, p2, fn2))
 
 
+def get_chu_ids_by_times(grp_id, mch_id, rnd):
+    ''' maps timestamps to ids of all chunks of given speaker in given round
+
+    args:
+        grp_id: group id
+        mch_id: machine id (subject index) of the speaker
+        rnd: round in which the session took place
+    returns:
+        dictionary with lists of chu_ids by (start_time, end_time) tuples
+    '''
+    sql_stmt = \
+        'SELECT chu.chu_id,\n' \
+        '       chu.start_time,\n' \
+        '       chu.end_time\n' \
+        'FROM   sessions ses\n' \
+        'JOIN   tasks tsk\n' \
+        'ON     ses.ses_id == tsk.ses_id\n' \
+        'JOIN   turns tur\n' \
+        'ON     tsk.tsk_id == tur.tsk_id\n' \
+        'JOIN   speakers spk\n' \
+        'ON     tur.spk_id == spk.spk_id\n' \
+        'JOIN   chunks chu\n' \
+        'ON     tur.tur_id == chu.tur_id\n' \
+        'WHERE  ses.grp_id == ?\n' \
+        'AND    ses.rnd == ?\n' \
+        'AND    spk.subject_index == ?;'
+    chu_ids = {}
+    for chu_id, start, end in dbc.execute(sql_stmt, (grp_id, rnd, mch_id)):
+        chu_ids.setdefault((start, end), []).append(chu_id)
+    return chu_ids
+
+
 def set_words(grp_id, mch_id, rnd, start, end, words_fin, words_asr):
     ''' sets transcriptions for chunk of given speaker with given timestamps '''
-    sql_stmt = \
-        'UPDATE chunks\n' \
-        'SET    words = ?,\n' \
-        '       words_asr1 = ?\n' \
-        'WHERE  chu_id == (\n' \
-        '           SELECT chu.chu_id\n' \
-        '           FROM   chunks chu\n' \
-        '           JOIN   turns tur\n' \
-        '           ON     chu.tur_id == tur.tur_id\n' \
-        '           JOIN   tasks tsk\n' \
-        '           ON     tur.tsk_id == tsk.tsk_id\n' \
-        '           JOIN   sessions ses\n' \
-        '           ON     tsk.ses_id == ses.ses_id\n' \
-        '           JOIN   speakers spk_a\n' \
-        '           ON     ses.spk_id_a == spk_a.spk_id\n' \
-        '           JOIN   speakers spk_b\n' \
-        '           ON     ses.spk_id_b == spk_b.spk_id\n' \
-        '           WHERE  ses.grp_id == ?\n' \
-        '           AND    CASE\n' \
-        '                      WHEN tur.speaker_role == "d"\n' \
-        '                      AND  tsk.a_or_b == "A"\n' \
-        '                      THEN spk_a.subject_index\n' \
-        '                      WHEN tur.speaker_role == "f"\n' \
-        '                      AND  tsk.a_or_b == "B"\n' \
-        '                      THEN spk_a.subject_index\n' \
-        '                      ELSE spk_b.subject_index\n' \
-        '                  END == ?\n' \
-        '           AND    ses.rnd == ?\n' \
-        '           AND    chu.start_time == ?\n' \
-        '           AND    chu.end_time == ?\n' \
-        ');'
-    params = (words_fin, words_asr, grp_id, mch_id, rnd, start, end)
-    dbc.execute(sql_stmt, params)
-    if dbc.getrowcount() > 1:
+    chu_ids = get_chu_ids_by_times(grp_id, mch_id, rnd).get((start, end), [])
+    if len(chu_ids) > 1:
         raise ValueError('multiple chunks found for grp %d, mch %d, rnd %d, ' \
                          'start %f, end %f' % (grp_id, mch_id, rnd, start, end))
-    elif dbc.getrowcount() == 0:
+    elif len(chu_ids) == 0:
         raise ValueError('no chunks found for grp %d, mch %d, rnd %d, ' \
                          'start %f, end %f' % (grp_id, mch_id, rnd, start, end))
+    set_words_bulk([(chu_ids[0], words_fin, words_asr)])
+
+
+def set_words_bulk(words):
+    ''' sets transcriptions of many chunks with a single executemany
+
+    args:
+        words: iterable of (chu_id, words_fin, words_asr) tuples
+    '''
+    sql_stmt = \
+        'UPDATE chunks\n' \
+        'SET    words = ?,\n' \
+        '       words_asr1 = ?\n' \
+        'WHERE  chu_id == ?;'
+    dbc.executemany(sql_stmt, ((words_fin, words_asr, chu_id)
+                               for chu_id, words_fin, words_asr in words))
 
 
 def store_annotations(annotator, ses_id, anns):
     ''' writes given annotator's annotations for given session to db '''
+    store_annotations_bulk([(annotator, ses_id, anns)])
+
+
+def store_annotations_bulk(batches):
+    ''' writes many batches of annotations with a single executemany
+
+    each batch gets the next annotation index of its annotator and session,
+    as if the batches were stored one after the other
+
+    args:
+        batches: iterable of (annotator, ses_id, anns) tuples, with anns as
+            dictionary of (unix_ts, annotation) tuples by 0-based turn index
+    '''
     sql_stmt = \
         'INSERT INTO turn_annotations(' \
         'tur_id, annotator, ann_index, ann_unix_ts, ' \
         'outlier_intensity, outlier_pitch, outlier_speech_rate, ' \
         'outlier_creaky, outlier_breathy, valence, arousal, turn_flagged) ' \
         'VALUES (?,?,?,?,?,?,?,?,?,?,?,?);'
-    ann_index = get_next_ann_index(annotator, ses_id)
-    for key, (unix_ts, ann) in anns.items():
-        tur_id = get_tur_id(ses_id, key + 1)
-        if 'emotions' not in ann:
-            valence = None
-            arousal = None
+    tur_ids = {}
+    ann_indices = {}
+    params = []
+    for annotator, ses_id, anns in batches:
+        if len(anns) == 0:
+            continue
+        if ses_id not in tur_ids:
+            tur_ids[ses_id] = get_tur_ids(ses_id)
+        if (annotator, ses_id) not in ann_indices:
+            ann_indices[(annotator, ses_id)] = \
+                get_next_ann_index(annotator, ses_id)
         else:
-            valence = ','.join([str(va['v']) for va in ann['emotions']])
-            arousal = ','.join([str(va['a']) for va in ann['emotions']])
-        turn_flagged = int(ann['turnFlag']) if 'turnFlag' in ann else None
-        params = (tur_id, annotator, ann_index, unix_ts, ann['intensity'],
-                  ann['pitch'], ann['rate'], ann['creaky'], ann['breathy'],
-                  valence, arousal, turn_flagged)
-        dbc.execute(sql_stmt, params)
+            ann_indices[(annotator, ses_id)] += 1
+        ann_index = ann_indices[(annotator, ses_id)]
+        for key, (unix_ts, ann) in anns.items():
+            if key + 1 not in tur_ids[ses_id]:
+                raise ValueError('no turn %d in session %d' % (key + 1, ses_id))
+            if 'emotions' not in ann:
+                valence = None
+                arousal = None
+            else:
+                valence = ','.join([str(va['v']) for va in ann['emotions']])
+                arousal = ','.join([str(va['a']) for va in ann['emotions']])
+            turn_flagged = int(ann['turnFlag']) if 'turnFlag' in ann else None
+            params += [(tur_ids[ses_id][key + 1], annotator, ann_index,
+                        unix_ts, ann['intensity'], ann['pitch'], ann['rate'],
+                        ann['creaky'], ann['breathy'], valence, arousal,
+                        turn_flagged)]
+    dbc.executemany(sql_stmt, params)
     
     
     
@@ -0,0 +1,204 @@
+import itertools
+import multiprocessing
+import numpy as np
+import pandas as pd
+import time
+
+import aux
+import cfg
+import db
+import fio
+
+# this module contains the engine for acoustic-prosodic feature extraction;
+# chunks are distributed over a pool of worker processes, results are written
+# to the database by the main process only (sqlite allows one writer) in
+# regular commits, so interrupted runs can be resumed from the database
+
+
+
+################################################################################
+#                        NON-PUBLIC AUXILIARY FUNCTIONS                        #
+################################################################################
+
+def _find_jobs(status, op, done, backend):
+    ''' collects chunks of all sessions with certain status, minus done ones
+
+    batch backends get one job per speaker and session, all other backends one
+    job per chunk; each job is a (backend, path, fname, ses_id, a_or_b, chunks)
+    tuple, with chunks as yielded by db.find_chunks
+    '''
+    jobs = []
+    for _, ses_id, _, _, ((_, pA, fnA), (_, pB, fnB)) \
+    in db.find_sessions(status, op):
+        for a_or_b, path, fname in [('A', pA, fnA), ('B', pB, fnB)]:
+            if not fname:
+                continue # no audio for woz
+            chunks = [chu for chu in db.find_chunks(ses_id, a_or_b)
+                      if chu[0] not in done]
+            if backend == cfg.FEA_BACKEND_PRAAT_BATCH:
+                jobs += [(backend, path, fname, ses_id, a_or_b, chunks)] \
+                    if len(chunks) > 0 else []
+            else:
+                jobs += [(backend, path, fname, ses_id, a_or_b, [chu])
+                         for chu in chunks]
+    return jobs
+
+
+def _run_job(job):
+    ''' extracts features for a single job (runs in worker processes) '''
+    backend, path, fname, ses_id, a_or_b, chunks = job
+    if backend == cfg.FEA_BACKEND_PRAAT_BATCH:
+        return fio.extract_features_batch(path, fname, ses_id, a_or_b, chunks)
+    return [(chu_id, fio.extract_features(
+                path, fname, ses_id, chu_id, words, start, end, backend))
+            for chu_id, words, start, end in chunks]
+
+
+def _flush(pending):
+    ''' writes and commits pending (chu_id, features) '''
+    db.set_features_bulk(pending)
+    db.commit()
+    pending.clear()
+
+
+
+################################################################################
+#                               PUBLIC FUNCTIONS                               #
+################################################################################
+
+def extract_all(status=3, op='>=', processes=cfg.FEA_PROCESSES, resume=True,
+                backend=cfg.FEA_BACKEND):
+    ''' extracts features for all chunks of all sessions with certain status
+
+    args:
+        status: session status to filter for (see db.find_sessions)
+        op: comparison operator for status (see db.find_sessions)
+        processes: number of worker processes (None for one per cpu core, 1
+            to run everything in the main process)
+        resume: whether to skip chunks that already have features in the db
+            (by whichever backend); if false, all chunks are processed (e.g.,
+            to replace values after switching backend)
+        backend: how to extract features (see cfg.FEA_BACKENDS)
+    returns:
+        number of chunks processed in this run
+    '''
+    cfg.check_fea_backend(backend)
+    done = db.get_chu_ids_with_features() if resume else set()
+    jobs = _find_jobs(status, op, done, backend)
+    total = sum([len(job[5]) for job in jobs])
+    print('%d chunks to process' % total)
+
+    pool = multiprocessing.Pool(processes) if processes != 1 else None
+    results = pool.imap_unordered(_run_job, jobs) if pool \
+        else map(_run_job, jobs)
+    pending = []
+    cnt = 0
+    t0 = time.time()
+    try:
+        for job_results in results:
+            pending += job_results
+            cnt += len(job_results)
+            if len(pending) >= cfg.FEA_COMMIT_SIZE:
+                _flush(pending)
+                print('%d/%d chunks done (%.1f per sec)'
+                      % (cnt, total, cnt / (time.time() - t0)))
+    finally:
+        # keep whatever was finished, even if a worker failed
+        _flush(pending)
+        if pool:
+            pool.terminate()
+            pool.join()
+    print('%d chunks done' % cnt)
+    return cnt
+
+
+def compare_backends(status=3, op='>=', backend=cfg.FEA_BACKEND_NUMPY,
+                     processes=cfg.FEA_PROCESSES):
+    ''' compares features from given backend with those in the db (by praat)
+
+    features are extracted for all chunks of all sessions with certain status
+    but not written to the db (regardless of the values already in the db)
+
+    args:
+        status: session status to filter for (see db.find_sessions)
+        op: comparison operator for status (see db.find_sessions)
+        backend: backend to compare with the db values (see cfg.FEA_BACKENDS)
+        processes: number of worker processes (see extract_all)
+    returns:
+        pandas dataframe with db value, backend value, and difference per chunk
+        and feature (columns "*_db", "*_new", "*_diff"), indexed by chu_id;
+        second dataframe with summary per feature (number of chunks with values
+        in both, with value in only one, mean absolute and relative difference,
+        and correlation)
+    '''
+    cfg.check_fea_backend(backend)
+    jobs = _find_jobs(status, op, set(), backend)
+    if processes != 1:
+        with multiprocessing.Pool(processes) as pool:
+            job_results = pool.map(_run_job, jobs)
+    else:
+        job_results = map(_run_job, jobs)
+    df_new = pd.DataFrame.from_dict(
+        {chu_id: {f: features[k] for f, k in cfg.FEATURE_KEYS.items()}
+         for results in job_results for chu_id, features in results},
+        orient='index', dtype=float)
+    df_new.index.name = 'chu_id'
+    df_db = db.pd_read_sql_query(
+        'SELECT chu_id, %s FROM chunks' % ', '.join(cfg.FEATURES_ALL))
+    df_db = df_db.set_index('chu_id').astype(float)
+    df_cmp = df_db.join(df_new, how='inner', lsuffix='_db', rsuffix='_new')
+    summary = {}
+    for f in cfg.FEATURES_ALL:
+        diffs = df_cmp[f + '_new'] - df_cmp[f + '_db']
+        diffs.name = f + '_diff'
+        df_cmp = df_cmp.join(diffs)
+        has_db = pd.notna(df_cmp[f + '_db'])
+        has_new = pd.notna(df_cmp[f + '_new'])
+        summary[f] = {
+            'n_both': int((has_db & has_new).sum()),
+            'n_one': int((has_db != has_new).sum()),
+            'mean_abs_diff': diffs.abs().mean(),
+            'mean_rel_diff': (diffs / df_cmp[f + '_db'].where(
+                df_cmp[f + '_db'] != 0)).abs().mean(),
+            'r': df_cmp[f + '_db'].corr(df_cmp[f + '_new'])
+        }
+    cols = list(itertools.chain(
+        *[[f + '_db', f + '_new', f + '_diff'] for f in cfg.FEATURES_ALL]))
+    return df_cmp.loc[:, cols], pd.DataFrame(summary).transpose()
+
+
+def update_rate_syl(status=3, op='>='):
+    ''' recomputes syllable rate of all chunks from their current words
+
+    no audio is processed, so changes to transcripts or to the syllable count
+    rules (see aux.count_syllables) can be applied to the whole corpus without
+    rerunning the feature extraction; each distinct token is counted once
+
+    args:
+        status: session status to filter for (see db.get_chu_words)
+        op: comparison operator for status (see db.get_chu_words)
+    returns:
+        number of chunks updated
+    '''
+    chunks = db.get_chu_words(status, op)
+    if len(chunks) == 0:
+        return 0
+    chu_ids, words, starts, ends = zip(*chunks)
+    # tokenize once (as in aux.count_syllables), remember chunk of each token
+    tokens = [w.split(' ') if w is not None else [] for w in words]
+    chu_idx = np.repeat(np.arange(len(tokens)), [len(t) for t in tokens])
+    syl_cnts = {tok: aux.count_word_syllables(tok)
+                for tok in set(itertools.chain.from_iterable(tokens))}
+    syls = np.bincount(chu_idx, minlength=len(tokens), weights=np.array(
+        [syl_cnts[tok] for tok in itertools.chain.from_iterable(tokens)],
+        dtype=float))
+    durs = np.array(ends, dtype=float) - np.array(starts, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = syls / durs
+    # no rate without words or for empty intervals
+    valid = np.array([w is not None for w in words]) & (durs > 0)
+    db.set_rate_syl_bulk(
+        (chu_id, float(rate) if is_valid else None)
+        for chu_id, rate, is_valid in zip(chu_ids, rates, valid))
+    db.commit()
+    return len(chunks)
@@ -1,17 +1,28 @@
 import json
-import nltk
+import numpy as np
 import os
-import shutil
 import subprocess
 
 import aux
 import cfg
 import db
+import sig
+import wav
 
 # this module contains functions for all file i/o
 
 
 
+################################################################################
+#                               MODULE VARIABLES                               #
+################################################################################
+
+# turn audio being assembled in memory, written once by write_tur_files;
+# (ses_id, sample rate, list of frame arrays) per turn wav path and file name
+_tur_audio = {}
+
+
+
 ################################################################################
 #                            GET PATH AND FILE NAMES                           #
 ################################################################################
@@ -78,6 +89,23 @@ def _write(path, fname, out_str, append=False):
         file.write(out_str)
 
 
+def _append_frames(out_pfn, frames):
+    ''' appends given raw audio frames to given wav file
+
+    frames are only buffered if the file was initialized by init_tur_file
+    (then written by write_tur_files), otherwise the file is rewritten
+    '''
+    if out_pfn in _tur_audio:
+        _tur_audio[out_pfn][2].append(frames)
+        return
+    # turn files change, so they are not cached; copy frames before rewriting
+    out_wav = wav.open_wav('', out_pfn, cache=False)
+    frames = np.concatenate([out_wav.get_frames(), frames])
+    rate = out_wav.rate
+    del out_wav
+    wav.write_frames('', out_pfn, frames, rate)
+
+
 def write_woz_msgs_file(ses_id, msgs):
     ''' writes wizard of oz messages for given session to default dir '''
     out_str = '\n'.join(['%s\t%s' % (aux.round_ts(msg[0]), msg[1]) 
@@ -133,34 +161,36 @@ def init_tur_file(ses_id, turn_index, wav_or_txt='wav', suf=''):
     # make sure path exists
     if not os.path.exists(path):
         os.mkdir(path)
-    # create empty file of appropriate type
+    # create empty file of appropriate type; audio is assembled in memory
+    # and only written by write_tur_files
     if wav_or_txt == 'wav':
-        subprocess.check_call([
-            'sox', cfg.WAV_PATH + 'sil.wav', path + fname, 'trim', '0', '0.01'])
+        sil_wav = wav.open_wav(cfg.WAV_PATH, 'sil.wav')
+        _tur_audio[path + fname] = \
+            (ses_id, sil_wav.rate, [sil_wav.get_frames(0.0, 0.01)])
     else:
         _write(path, fname, '')
 
 
+def write_tur_files(ses_id=None):
+    ''' writes all turn audio assembled in memory (for given ses, if any) '''
+    for pfn in list(_tur_audio.keys()):
+        tur_ses_id, rate, frames = _tur_audio[pfn]
+        if ses_id is None or tur_ses_id == ses_id:
+            wav.write_frames('', pfn, np.concatenate(frames), rate)
+            del _tur_audio[pfn]
+
+
 def concat_wavs(in_fname1, in_fname2):
     ''' concatenates a second audio file to the end of a first one '''
-    con_fname = cfg.TMP_PATH + 'concat.wav'
-    # concatenate files: create new file, replace original 1st file by new one
-    subprocess.check_call(['sox', in_fname1, in_fname2, con_fname])
-    os.remove(in_fname1)
-    shutil.move(con_fname, in_fname1)
+    in_wav2 = wav.open_wav('', in_fname2, cache=False)
+    _append_frames(in_fname1, in_wav2.get_frames())
 
 
 def append_silence(path, tur_fname, duration):
     ''' appends up to 1 sec of silence to audio of given turn in given ses '''
     dur = min(1.0, duration)
-    # file names for sox commands
-    out_fname = path + tur_fname
-    sil_fname = cfg.WAV_PATH + 'sil.wav'
-    tmp_fname = cfg.TMP_PATH + 'tmp_sil.wav'
-    # prepare appropriate amount of silence, append, clean up
-    subprocess.check_call(['sox', sil_fname, tmp_fname, 'trim', '0', str(dur)])
-    concat_wavs(out_fname, tmp_fname)
-    os.remove(tmp_fname)
+    sil_wav = wav.open_wav(cfg.WAV_PATH, 'sil.wav')
+    _append_frames(path + tur_fname, sil_wav.get_frames(0.0, dur))
 
 
 def concat_turns(ses_id, turn_index_ctr, turn_index_start, turn_index_end, suf):
@@ -174,8 +204,11 @@ def concat_turns(ses_id, turn_index_ctr, turn_index_start, turn_index_end, suf):
         a_or_b_i = db.get_tur_spk(ses_id, i)[0]
         if a_or_b_ctr == a_or_b_i:
             # only audio from same speaker
-            concat_wavs(path + fname, ''.join(get_tur_pfn(ses_id, i)))
+            tur_wav = wav.open_wav(*get_tur_pfn(ses_id, i), cache=False)
+            _append_frames(path + fname, tur_wav.get_frames())
             append_silence(path, fname, 0.25)
+    # sample is assembled in memory, write it once
+    write_tur_files(ses_id)
 
 
 def append_newline(ses_id, turn_index):
@@ -187,14 +220,9 @@ def append_newline(ses_id, turn_index):
 def append_chunk_audio(ses_id, turn_index, in_path, in_fname, start, end):
     ''' appends section of session audio to audio of given turn in given ses '''
     out_path, out_fname = get_tur_pfn(ses_id, turn_index)
-    in_fname = in_path + in_fname
-    out_fname = out_path + out_fname
-    cut_fname = cfg.TMP_PATH + str(ses_id) + '_' + str(turn_index) + '_cut.wav'
-    # extract chunk audio, append, clean up
-    subprocess.check_call([
-        'sox', in_fname, cut_fname, 'trim', str(start), '=' + str(end)])
-    concat_wavs(out_fname, cut_fname)
-    os.remove(cut_fname)
+    # chunk audio is a view of the mapped session audio, no tmp file needed
+    frames = wav.open_wav(in_path, in_fname).get_frames(start, end)
+    _append_frames(out_path + out_fname, frames)
 
 
 def append_line(ses_id, turn_index, line):
@@ -205,6 +233,8 @@ def append_line(ses_id, turn_index, line):
 
 def write_tur_list(ses_id):
     ''' writes json file with data for psiturk annotation scripts '''
+    # make sure all audio assembled in memory for this session is on disk
+    write_tur_files(ses_id)
     path, _ = get_tur_pfn(ses_id, 1)
     fname = 'list.json'
     if os.path.exists(path + fname):
@@ -229,6 +259,16 @@ def readlines(path, fname):
         return file.readlines()
 
 
+def read_wav_samples(path, fname, start, end):
+    ''' reads section of given wav file into float array (mono, -1 to 1)
+
+    returns:
+        numpy array with samples and sample rate
+    '''
+    wav_file = wav.open_wav(path, fname)
+    return wav_file.get_samples(start, end), wav_file.rate
+
+
 def read_tsk_interval_file(ses_id):
     lines = readlines(cfg.TSK_PATH, 'ses_%d.txt' % ses_id)
     return [[float(v) for v in line.split('\t')] for line in lines]
@@ -315,16 +355,31 @@ def check_vad_textgrid_file(path, fname):
     return all_good
 
 
-def extract_features(in_path, in_fname, ses_id, chu_id, words, start, end):
-    ''' runs praat script for feature extraction on given chunk '''
+def extract_features(in_path, in_fname, ses_id, chu_id, words, start, end,
+                     backend=cfg.FEA_BACKEND_PRAAT):
+    ''' extracts features for given chunk, via praat script or numpy
+
+    args:
+        in_path, in_fname: path and file name of the session audio
+        ses_id, chu_id: session and chunk (only used for tmp filenames)
+        words, start, end: transcript and timestamps of the chunk
+        backend: cfg.FEA_BACKEND_PRAAT or cfg.FEA_BACKEND_NUMPY
+    returns:
+        dictionary of features (see cfg.FEATURE_KEYS), None where undefined
+    '''
+    assert backend in [cfg.FEA_BACKEND_PRAAT, cfg.FEA_BACKEND_NUMPY], \
+        'unsupported backend for single chunk extraction'
+    if backend == cfg.FEA_BACKEND_NUMPY:
+        # no subprocess or tmp file, compute directly on the samples
+        samples, rate = read_wav_samples(in_path, in_fname, start, end)
+        features = sig.get_features(samples, rate)
+        features['rate_syl'] = aux.count_syllables(words) / (end - start)
+        return features
     # determine tmp filenames
     cut_fname = '%d_%d.wav' % (ses_id, chu_id)
     out_fname = '%d_%d.txt' % (ses_id, chu_id)
-    # extract audio and features
-    subprocess.check_call(['sox', 
-                           in_path + in_fname, 
-                           cfg.TMP_PATH + cut_fname, 
-                           'trim', str(start), '=' + str(end)])
+    # extract audio (praat needs a file) and features
+    wav.open_wav(in_path, in_fname).write(cfg.TMP_PATH, cut_fname, start, end)
     subprocess.check_call(['praat', '--run', 
                            cfg.PRAAT_SCRIPT_FNAME,
                            cfg.TMP_PATH + cut_fname, 
@@ -346,6 +401,51 @@ def extract_features(in_path, in_fname, ses_id, chu_id, words, start, end):
     return features
 
 
+def extract_features_batch(in_path, in_fname, ses_id, a_or_b, chunks):
+    ''' runs praat batch script for feature extraction on given chunks 
 
+    args:
+        in_path, in_fname: path and file name of the session audio
+        ses_id: session the chunks belong to
+        a_or_b: speaker the chunks belong to (only used for tmp filenames)
+        chunks: list of (chu_id, words, start, end) tuples
+    returns:
+        list of (chu_id, features) tuples, features as in extract_features
+    '''
+    # determine tmp filenames
+    chu_fname = '%d_%s_chunks.csv' % (ses_id, a_or_b)
+    out_fname = '%d_%s_features.csv' % (ses_id, a_or_b)
+    # write chunk intervals, extract features for all chunks in one praat run
+    out_str = 'chu_id,start,end\n' + \
+        ''.join(['%d,%s,%s\n' % (chu_id, start, end)
+                 for chu_id, _, start, end in chunks])
+    _write(cfg.TMP_PATH, chu_fname, out_str)
+    subprocess.check_call(['praat', '--run', 
+                           cfg.PRAAT_BATCH_SCRIPT_FNAME,
+                           in_path + in_fname,
+                           cfg.TMP_PATH + chu_fname, 
+                           cfg.TMP_PATH + out_fname])
+    # process output (header line with keys, then one line per chunk)
+    lines = readlines(cfg.TMP_PATH, out_fname)
+    keys = lines[0].replace('\n', '').split(',')[1:]
+    words_etc = {chu_id: (words, start, end) 
+                 for chu_id, words, start, end in chunks}
+    results = []
+    for line in lines[1:]:
+        vals = line.replace('\n', '').split(',')
+        chu_id = int(vals[0])
+        features = {}
+        for key, val in zip(keys, vals[1:]):
+            try:
+                val = float(val)
+            except:
+                val = None
+            features[key] = val
+        words, start, end = words_etc[chu_id]
+        features['rate_syl'] = aux.count_syllables(words) / (end - start)
+        results += [(chu_id, features)]
+    # clean up
+    os.remove(cfg.TMP_PATH + chu_fname)
+    os.remove(cfg.TMP_PATH + out_fname)
 
-
+    return results
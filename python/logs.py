@@ -1,7 +1,9 @@
+import multiprocessing
 from os import listdir
 import sqlite3
 
 import aux
+import cfg
 import db
 import fio
 
@@ -57,16 +59,33 @@ _first_roles = [
 #                        NON-PUBLIC AUXILIARY FUNCTIONS                        #
 ################################################################################
 
-def _insert_tasks(ses_id, ses_type, a_or_b):
+def _get_tasks(ses_id, ses_type, a_or_b):
+    ''' returns (ses_id, task_index, a_or_b) tuples for tasks of a session '''
     if ses_type == 'CONV':
-        db.ins_tsk(ses_id, 1, 'A')
-    else:
-        for i in range(1, 15):
-            db.ins_tsk(ses_id, i, a_or_b)
-            a_or_b = 'A' if a_or_b == 'B' else 'B'
+        return [(ses_id, 1, 'A')]
+    tasks = []
+    for i in range(1, 15):
+        tasks += [(ses_id, i, a_or_b)]
+        a_or_b = 'A' if a_or_b == 'B' else 'B'
+    return tasks
+
 
+def _get_group_sessions_tasks(grp_id):
+    ''' returns records for a group and the associated sessions and tasks
 
-def _insert_sessions_tasks(grp_id, cfg_seq, games_first):
+    returns:
+        group, sessions, and tasks as tuples of the arguments of db.ins_grp,
+        db.ins_ses, and db.ins_tsk, respectively (lists for the latter two)
+    '''
+    sex_seq = 'MFMF' if grp_id < 7 else 'FMFM'
+    cfg_seq = 'DBFAA21' if grp_id % 4 == 1 \
+        else '21DBFAA' if grp_id % 4 == 2 \
+        else 'AFBDD12' if grp_id % 4 == 3 \
+        else '12AFBDD'
+    games_first = aux.has_games_first(grp_id)
+    grp = (grp_id, sex_seq, cfg_seq, games_first)
+    sessions = []
+    tasks = []
     for rnd in range(1, 8):
         # for each round, there are two sessions, either between two 
         # pairs of subjects or between two pairs of a subject and WOZ
@@ -96,45 +115,135 @@ def _insert_sessions_tasks(grp_id, cfg_seq, games_first):
         ses_id1 = aux.get_ses_id(grp_id, rnd, 1)
         ses_id2 = aux.get_ses_id(grp_id, rnd, 2)
         
-        # create two db records
-        db.ins_ses(ses_id1, grp_id, spk_id_1a, spk_id_1b, rnd, ses_type, cfg)
-        db.ins_ses(ses_id2, grp_id, spk_id_2a, spk_id_2b, rnd, ses_type, cfg)
+        # create two session records
+        sessions += [
+            (ses_id1, grp_id, spk_id_1a, spk_id_1b, rnd, ses_type, cfg),
+            (ses_id2, grp_id, spk_id_2a, spk_id_2b, rnd, ses_type, cfg)]
 
         a_or_b1 = \
             'A' if _first_roles[games_first][mch_id_1a][rnd] == 'd' else 'B'
         a_or_b2 = \
             'A' if _first_roles[games_first][mch_id_2a][rnd] == 'd' else 'B'
-        _insert_tasks(ses_id1, ses_type, a_or_b1)
-        _insert_tasks(ses_id2, ses_type, a_or_b2)
+        tasks += _get_tasks(ses_id1, ses_type, a_or_b1)
+        tasks += _get_tasks(ses_id2, ses_type, a_or_b2)
+    return grp, sessions, tasks
 
 
-def _extract_ratings(lines):
-    return [int(lines[-2][-2]), int(lines[-1][-2])]
+def _parse_question_log(grp_id, mch_id):
+    ''' returns (qai_id, seq, val, ts) tuples for responses of a subject '''
+    lines = fio.read_questionnaire_file(grp_id, mch_id)
+    us_start = aux.get_ts_us(lines[1])
+    responses = []
+    for line in lines[1:]:
+        line = line.replace(' ', '\t').replace('\n', '')
+        items = line.split('\t')
+        ts = aux.get_ts_us_offset(us_start, line)
+        qai_id = int(items[2][1])
+        que_seq = items[2][3:-1]
+        if qai_id == 1 and que_seq[0] == '5':
+            que_seq = 5 + int(que_seq[-1])
+        else:
+            que_seq = int(que_seq)
+        val = ' '.join(items[3:])
+        responses += [(qai_id, que_seq, val, ts)]
+    return responses
 
 
-def _extract_scores(lines):
-    return [int(line.split('\t')[2].split()[0]) 
-            for line in lines if 'RESULTS' in line]
+def _extract_ratings(lines):
+    return [int(lines[-2][-2]), int(lines[-1][-2])]
 
 
-def _extract_woz_msgs(lines):
-    ts_start = aux.get_ts(lines[1])
-    return [(aux.get_ts_offset(ts_start, line), line.split('\t')[2].strip())
-            for line in lines if 'WOZ_MSG' in line]
+def _parse_session_log(lines, ses_type, is_woz):
+    ''' extracts scores, woz messages, and task intervals in a single pass
 
+    each line is classified once by the event it contains ("RESULTS",
+    "WOZ_MSG", "NEXT_TURN", "END_GAME"); only lines of these events have
+    their timestamps parsed (see aux.get_ts_us)
 
-def _extract_task_intervals(lines):
-    ts_start = aux.get_ts(lines[1])
+    args:
+        lines: lines of the session log (of the first speaker)
+        ses_type: "GAME" or "CONV"; scores are only extracted for games
+        is_woz: whether woz messages are extracted
+    returns:
+        list of scores, list of (offset, message) tuples for woz messages,
+        and list of [start, end] task intervals
+    '''
+    us_start = aux.get_ts_us(lines[1])
+    scores = []
+    woz_msgs = []
     intervals = []
     start = 0.0
     turn = 0
     for line in lines:
-        turn += 1 if 'NEXT_TURN' in line else 0
-        if ('NEXT_TURN' in line and turn > 1) or 'END_GAME' in line:
-            end = float(aux.round_ts(aux.get_ts_offset(ts_start, line)))
+        if ses_type == 'GAME' and 'RESULTS' in line:
+            scores += [int(line.split('\t')[2].split()[0])]
+        if is_woz and 'WOZ_MSG' in line:
+            woz_msgs += [(aux.get_ts_us_offset(us_start, line),
+                          line.split('\t')[2].strip())]
+        is_next_turn = 'NEXT_TURN' in line
+        turn += 1 if is_next_turn else 0
+        if (is_next_turn and turn > 1) or 'END_GAME' in line:
+            end = float(aux.round_ts(aux.get_ts_us_offset(us_start, line)))
             intervals += [[start, end]]
             start = end
-    return intervals
+    return scores, woz_msgs, intervals
+
+
+
+def _process_session_log_files(grp_id, ses_id, ses_type, rnd, mch_id1,
+                               mch_id2):
+    ''' parses logs of a session and writes its woz messages and intervals
+
+    returns:
+        ratings (both lists of two, None for woz), scores (None for
+        conversations), session init time, and group record date
+    '''
+    is_woz = mch_id2 == 0
+    lines1, d, t = fio.read_log_file(grp_id, mch_id1, rnd, ses_type, is_woz)
+    scores, woz_msgs, intervals = _parse_session_log(lines1, ses_type, is_woz)
+    ratings = None
+    if is_woz:
+        fio.write_woz_msgs_file(ses_id, woz_msgs)
+    else:
+        lines2, _, _ = fio.read_log_file(grp_id, mch_id2, rnd, ses_type, False)
+        ratings = (_extract_ratings(lines1), _extract_ratings(lines2))
+    fio.write_tsk_interval_file(ses_id, intervals)
+    return ratings, scores if ses_type == 'GAME' else None, t, d
+
+
+def _store_session_log_data(ses_id, ratings, scores, t):
+    ''' stores data returned by _process_session_log_files for a session '''
+    if ratings is not None:
+        db.set_ratings(ses_id, *ratings)
+    if scores is not None:
+        db.set_scores(ses_id, scores)
+    db.set_ses_time(ses_id, t)
+    db.set_ses_status(ses_id, 1)
+
+
+def _parse_group(grp_id):
+    ''' parses all logs of a group into records (runs in worker processes)
+
+    does not access the database; woz message and task interval files are
+    written directly (one per session, see _process_session_log_files)
+
+    returns:
+        tuple of group, sessions, and tasks (see _get_group_sessions_tasks),
+        list of (spk_id, mch_id, responses) tuples for the four subjects (see
+        _parse_question_log), list of (ses_id, ratings, scores, init_time)
+        tuples, and record date
+    '''
+    grp, sessions, tasks = _get_group_sessions_tasks(grp_id)
+    subjects = [(aux.get_spk_id(grp_id, mch_id), mch_id,
+                 _parse_question_log(grp_id, mch_id))
+                for mch_id in range(1, 5)]
+    ses_data = []
+    for ses_id, _, spk_id_a, spk_id_b, rnd, ses_type, _ in sessions:
+        ratings, scores, t, d = _process_session_log_files(
+            grp_id, ses_id, ses_type, rnd, aux.get_mch_id(grp_id, spk_id_a),
+            aux.get_mch_id(grp_id, spk_id_b))
+        ses_data += [(ses_id, ratings, scores, t)]
+    return grp, sessions, tasks, subjects, ses_data, d
 
 
 
@@ -144,35 +253,20 @@ def _extract_task_intervals(lines):
 
 def insert_group_sessions_tasks(grp_id):
     ''' inserts a group and the associated sessions and tasks '''
-    sex_seq = 'MFMF' if grp_id < 7 else 'FMFM'
-    cfg_seq = 'DBFAA21' if grp_id % 4 == 1 \
-        else '21DBFAA' if grp_id % 4 == 2 \
-        else 'AFBDD12' if grp_id % 4 == 3 \
-        else '12AFBDD'
-    games_first = aux.has_games_first(grp_id)
-    db.ins_grp(grp_id, sex_seq, cfg_seq, games_first)
-    _insert_sessions_tasks(grp_id, cfg_seq, games_first)
+    grp, sessions, tasks = _get_group_sessions_tasks(grp_id)
+    with db.batch():
+        db.ins_grp(*grp)
+        for ses in sessions:
+            db.ins_ses(*ses)
+        for tsk in tasks:
+            db.ins_tsk(*tsk)
 
 
 def process_question_log(grp_id, mch_id):
     ''' parses question log for given subject and stores responses ''' 
-    lines = fio.read_questionnaire_file(grp_id, mch_id)
-    ts_start = aux.get_ts(lines[1])
     spk_id = aux.get_spk_id(grp_id, mch_id)
     db.ins_spk(spk_id, mch_id)
-        
-    for line in lines[1:]:
-        line = line.replace(' ', '\t').replace('\n', '')
-        items = line.split('\t')
-        ts = aux.get_ts_offset(ts_start, line)
-        qai_id = int(items[2][1])
-        que_seq = items[2][3:-1]
-        if qai_id == 1 and que_seq[0] == '5':
-            que_seq = 5 + int(que_seq[-1])
-        else:
-            que_seq = int(que_seq)
-        val = ' '.join(items[3:])
-        
+    for qai_id, que_seq, val, ts in _parse_question_log(grp_id, mch_id):
         que_id = db.get_que_id(qai_id, que_seq)
         db.ins_qre(que_id, spk_id, val, ts)
 
@@ -186,23 +280,50 @@ def process_session_logs(grp_id):
     in db.find_sessions(0, grp_id=grp_id):
         # unpack mch_pair
         ((mch_id1, _, _), (mch_id2, _, _)) = mch_pair
-        is_woz = mch_id2 == 0
-        lines1, d, t = fio.read_log_file(grp_id, mch_id1, rnd, ses_type, is_woz)
-        if is_woz:
-            fio.write_woz_msgs_file(ses_id, _extract_woz_msgs(lines1))
-        else:
-            lines2, _, _ = fio.read_log_file(
-                grp_id, mch_id2, rnd, ses_type, False)
-            ratings1 = _extract_ratings(lines1)
-            ratings2 = _extract_ratings(lines2)
-            db.set_ratings(ses_id, ratings1, ratings2)
-            
-        if ses_type == 'GAME':
-            db.set_scores(ses_id, _extract_scores(lines1))
-        fio.write_tsk_interval_file(ses_id, _extract_task_intervals(lines1))
-        db.set_ses_time(ses_id, t)
-        db.set_ses_status(ses_id, 1)
+        ratings, scores, t, d = _process_session_log_files(
+            grp_id, ses_id, ses_type, rnd, mch_id1, mch_id2)
+        _store_session_log_data(ses_id, ratings, scores, t)
     db.set_grp_date(grp_id, d)
-    
 
 
+def process_groups(grp_ids, processes=cfg.LOG_PROCESSES):
+    ''' inserts and processes all data of given groups, parsing in parallel
+
+    same result as insert_group_sessions_tasks, process_question_log for all
+    four subjects, and process_session_logs for each group; groups are parsed
+    in worker processes, while all records are written by the main process,
+    in order of grp_ids, with que_ids looked up in a map loaded once; rows are
+    inserted in one batch per group (see db.batch) and each group is
+    committed as one transaction (a failing group is rolled back)
+
+    args:
+        grp_ids: list of groups to process (e.g., fio.get_grp_dir_indices())
+        processes: number of worker processes (None for one per cpu core, 1
+            to run everything in the main process)
+    '''
+    que_ids = db.get_que_ids()
+    pool = multiprocessing.Pool(processes) if processes != 1 else None
+    results = pool.imap(_parse_group, grp_ids) if pool \
+        else map(_parse_group, grp_ids)
+    try:
+        for grp, sessions, tasks, subjects, ses_data, d in results:
+            with db.batch():
+                db.ins_grp(*grp)
+                for ses in sessions:
+                    db.ins_ses(*ses)
+                for tsk in tasks:
+                    db.ins_tsk(*tsk)
+                for spk_id, mch_id, responses in subjects:
+                    db.ins_spk(spk_id, mch_id)
+                    for qai_id, que_seq, val, ts in responses:
+                        db.ins_qre(que_ids[(qai_id, que_seq)], spk_id, val,
+                                   ts)
+            # (updates only after the batch, they need the inserted rows)
+            for ses_id, ratings, scores, t in ses_data:
+                _store_session_log_data(ses_id, ratings, scores, t)
+            db.set_grp_date(grp[0], d)
+            db.commit()
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
@@ -0,0 +1,149 @@
+import base64
+import concurrent.futures
+import http.client
+import json
+import threading
+import time
+import urllib.parse
+
+import cfg
+
+# this module contains speech recognizers and a dispatcher that sends many
+# audio segments to a recognizer concurrently; watson is used for the corpus,
+# but any object with the same recognize method can replace it (e.g., a local
+# stand-in server with the same api, or an offline model wrapped in a
+# FunctionRecognizer) for tests and benchmarks
+
+
+
+################################################################################
+#                                  EXCEPTIONS                                  #
+################################################################################
+
+class RetryableError(Exception):
+    ''' recognizer failure that may succeed if the request is repeated '''
+    pass
+
+
+
+################################################################################
+#                                 RECOGNIZERS                                  #
+################################################################################
+
+class Recognizer(object):
+    ''' interface for speech recognizers used by recognize_all '''
+    def recognize(self, wav_pfn, dur):
+        ''' transcribes given wav file (must be safe to call from threads)
+
+        args:
+            wav_pfn: path and file name of audio segment
+            dur: duration of the segment (in seconds)
+        returns:
+            transcript and list of [word, start, end] timestamps
+        raises:
+            RetryableError for failures that are worth another attempt
+        '''
+        raise NotImplementedError()
+
+
+class WatsonRecognizer(Recognizer):
+    ''' watson speech-to-text via http, one persistent connection per thread
+
+    any server implementing the same "v1/recognize" endpoint can be used by
+    passing its url (http or https), e.g., a local stand-in for benchmarks
+    '''
+    def __init__(self, url=cfg.API_URL, api_key=cfg.API_KEY,
+                 instance=cfg.API_INS, timeout=cfg.ASR_TIMEOUT):
+        url = urllib.parse.urlsplit(url)
+        self.is_https = url.scheme == 'https'
+        self.netloc = url.netloc
+        self.path = url.path + instance + 'v1/recognize?timestamps=true'
+        auth = base64.b64encode(('apikey:' + api_key).encode()).decode()
+        self.headers = {
+            'Authorization': 'Basic ' + auth,
+            'Content-Type': 'audio/wav'
+        }
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _get_conn(self):
+        ''' returns this thread's connection, opening it if needed '''
+        if getattr(self._local, 'conn', None) is None:
+            conn_class = http.client.HTTPSConnection if self.is_https \
+                else http.client.HTTPConnection
+            self._local.conn = conn_class(self.netloc, timeout=self.timeout)
+        return self._local.conn
+
+    def _close_conn(self):
+        ''' closes this thread's connection (reopened on next request) '''
+        if getattr(self._local, 'conn', None) is not None:
+            self._local.conn.close()
+            self._local.conn = None
+
+    def recognize(self, wav_pfn, dur):
+        with open(wav_pfn, 'rb') as file:
+            data = file.read()
+        try:
+            conn = self._get_conn()
+            conn.request('POST', self.path, data, self.headers)
+            response = conn.getresponse()
+            body = response.read()
+        except (http.client.HTTPException, OSError) as e:
+            # connection may be broken (e.g., closed by server while idle)
+            self._close_conn()
+            raise RetryableError(str(e))
+        if response.status == 429 or response.status >= 500:
+            raise RetryableError('status %d from recognizer' % response.status)
+        if response.status != 200:
+            raise ValueError('status %d from recognizer: %s'
+                             % (response.status, body[:200]))
+        obj = json.loads(body)
+        try:
+            trans = obj['results'][0]['alternatives'][0]['transcript']
+            trans = trans[:-1]
+            ts = obj['results'][0]['alternatives'][0]['timestamps']
+        except IndexError:
+            trans = ''
+            ts = [['', 0.0, dur]]
+        return trans, ts
+
+
+class FunctionRecognizer(Recognizer):
+    ''' wraps a function with the signature of Recognizer.recognize '''
+    def __init__(self, func):
+        self.func = func
+
+    def recognize(self, wav_pfn, dur):
+        return self.func(wav_pfn, dur)
+
+
+
+################################################################################
+#                               PUBLIC FUNCTIONS                               #
+################################################################################
+
+def recognize_all(recognizer, segments, max_workers=cfg.ASR_MAX_WORKERS,
+                  retries=cfg.ASR_RETRIES, backoff=cfg.ASR_BACKOFF):
+    ''' transcribes all given segments with bounded concurrency
+
+    args:
+        recognizer: Recognizer to use
+        segments: list of (wav_pfn, dur) tuples (see Recognizer.recognize)
+        max_workers: maximum number of requests in flight at once
+        retries: number of additional attempts after a RetryableError
+        backoff: delay before first retry (in seconds), doubled for each
+            subsequent retry of the same segment
+    returns:
+        list of (transcript, timestamps) tuples, in order of segments
+    '''
+    def recognize(segment):
+        for attempt in range(retries + 1):
+            try:
+                return recognizer.recognize(*segment)
+            except RetryableError:
+                if attempt == retries:
+                    raise
+                time.sleep(backoff * 2 ** attempt)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        return list(executor.map(recognize, segments))
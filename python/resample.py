@@ -0,0 +1,254 @@
+import multiprocessing
+import numpy as np
+import pandas as pd
+
+import aux
+import cfg
+
+# this module contains non-parametric significance checks for the entrainment
+# measures in ap.py: permutation p-values and bootstrap confidence intervals;
+# resamples are drawn as numpy index (or sign) matrices and evaluated in
+# batches, each group gets its own random stream derived from one seed, so
+# results are reproducible regardless of the number of processes
+
+
+
+################################################################################
+#                               MODULE VARIABLES                               #
+################################################################################
+
+# columns identifying groups of data for each grp_by value (see cfg.GRP_BYS)
+_GRP_COLS = {
+    cfg.GRP_BY_SES_TYPE: ['ses_type'],
+    cfg.GRP_BY_SES: ['ses_type', 'ses_id'],
+    cfg.GRP_BY_SES_SPK: ['ses_type', 'ses_id', 'spk_id'],
+    cfg.GRP_BY_TSK: ['ses_type', 'ses_id', 'tsk_id'],
+    cfg.GRP_BY_TSK_SPK: ['ses_type', 'ses_id', 'tsk_id', 'spk_id']
+}
+
+# index names of result dataframes (same as for measures in ap.py)
+_INDEX_NAMES = ['ses_type', 'ses_id', 'tsk_id', 'spk_id']
+
+
+
+################################################################################
+#                        NON-PUBLIC AUXILIARY FUNCTIONS                        #
+################################################################################
+
+def _get_corrs(xs, ys):
+    ''' computes pearson correlation for each row of two 2d arrays '''
+    xs = xs - xs.mean(axis=1, keepdims=True)
+    ys = ys - ys.mean(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (xs * ys).sum(axis=1) \
+            / np.sqrt((xs * xs).sum(axis=1) * (ys * ys).sum(axis=1))
+
+
+def _get_batch_sizes(n_resamples, n):
+    ''' splits resamples into batches of at most cfg.RS_BATCH_ELEMS values '''
+    size = max(1, cfg.RS_BATCH_ELEMS // max(n, 1))
+    return [min(size, n_resamples - i) for i in range(0, n_resamples, size)]
+
+
+def _run_job(job):
+    ''' runs permutation test and bootstrap for one group and feature
+
+    args:
+        job: tuple of test type ("corr" or "mean"), values (two arrays for
+            "corr", one array of paired differences for "mean"), number of
+            resamples, alpha, and numpy SeedSequence for this job
+    returns:
+        tuple with statistic (r or mean difference), permutation p-value,
+        lower and upper bound of the bootstrap confidence interval, and
+        number of observations
+    '''
+    test, vals, n_resamples, alpha, seed = job
+    n = len(vals[0])
+    if n < (3 if test == 'corr' else 2):
+        return (np.nan, np.nan, np.nan, np.nan, n)
+    rng = np.random.default_rng(seed)
+    if test == 'corr':
+        x, y = vals
+        if np.all(x == x[0]) or np.all(y == y[0]):
+            # constant input, correlation undefined (as in scipy)
+            return (np.nan, np.nan, np.nan, np.nan, n)
+        stat = _get_corrs(x[None, :], y[None, :])[0]
+    else:
+        d = vals[0]
+        stat = d.mean()
+    if np.isnan(stat):
+        return (np.nan, np.nan, np.nan, np.nan, n)
+    # values at least as extreme (two-sided), with tolerance for rounding
+    thresh = abs(stat) * (1 - 1e-12)
+    n_extreme = 0
+    boots = []
+    for size in _get_batch_sizes(n_resamples, n):
+        idx = rng.integers(0, n, (size, n))
+        if test == 'corr':
+            # permutation: shuffle pairing; bootstrap: resample pairs
+            perms = rng.permuted(np.tile(np.arange(n), (size, 1)), axis=1)
+            n_extreme += int((np.abs(_get_corrs(
+                np.broadcast_to(x, (size, n)), y[perms])) >= thresh).sum())
+            boots += [_get_corrs(x[idx], y[idx])]
+        else:
+            # permutation: flip signs of differences (swap paired values);
+            # bootstrap: resample differences
+            signs = rng.choice([-1.0, 1.0], (size, n))
+            n_extreme += int((np.abs((signs * d).mean(axis=1))
+                              >= thresh).sum())
+            boots += [d[idx].mean(axis=1)]
+    p = (n_extreme + 1) / (n_resamples + 1)
+    lo, hi = np.nanpercentile(
+        np.concatenate(boots), [50 * alpha, 100 - 50 * alpha])
+    return (stat, p, lo, hi, n)
+
+
+def _run_all(jobs, keys, processes):
+    ''' runs all jobs and returns results dataframe (keys: (feature, index)) '''
+    if processes != 1:
+        with multiprocessing.Pool(processes) as pool:
+            job_results = pool.map(_run_job, jobs, chunksize=16)
+    else:
+        job_results = map(_run_job, jobs)
+    results = {f: {} for f in cfg.FEATURES}
+    for (f, key), res in zip(keys, job_results):
+        results[f][key] = res
+    return results
+
+
+def _get_jobs(df, grp_by, get_vals, test, n_resamples, alpha, seed):
+    ''' creates jobs for all groups and features in given dataframe
+
+    args:
+        df: pandas dataframe with one row per observation
+        grp_by: list of constants from cfg.GRP_BYS
+        get_vals: function that returns tuple of value arrays (see _run_job)
+            for given dataframe and feature, without nan values
+        test, n_resamples, alpha: see _run_job
+        seed: seed for random number generation
+    returns:
+        list of jobs and list of corresponding (feature, index) keys
+    '''
+    jobs = []
+    keys = []
+    seeds = iter(np.random.SeedSequence(seed).spawn(
+        len(cfg.FEATURES) * sum([df.groupby(_GRP_COLS[g], sort=False).ngroups
+                                 for g in grp_by])))
+    for g in grp_by:
+        # (unsorted, session types may be mixed with 0 for "all")
+        for grp_key, df_grp in df.groupby(_GRP_COLS[g], sort=False):
+            if not isinstance(grp_key, tuple):
+                grp_key = (grp_key,)
+            grp_key = dict(zip(_GRP_COLS[g], grp_key))
+            key = tuple(grp_key.get(c, 0) for c in _INDEX_NAMES)
+            for f in cfg.FEATURES:
+                jobs += [(test, get_vals(df_grp, f), n_resamples, alpha,
+                          next(seeds))]
+                keys += [(f, key)]
+    return jobs, keys
+
+
+
+################################################################################
+#                               PUBLIC FUNCTIONS                               #
+################################################################################
+# all functions return a pandas dataframe with one column per feature and one
+# tuple per cell: statistic, permutation p-value, lower and upper bound of the
+# bootstrap confidence interval, and number of observations; the index is the
+# same as for the respective measure in ap.py (0 for "all")
+#
+# common args:
+#     n_resamples: number of permutations and of bootstrap samples
+#     alpha: confidence intervals cover 1 - alpha
+#     seed: seed for random number generation (None for fresh entropy)
+#     processes: number of worker processes (None for one per cpu core, 1
+#         to run everything in the main process)
+
+def syn(df_bt, grp_by=[cfg.GRP_BY_SES, cfg.GRP_BY_SES_SPK],
+        n_resamples=cfg.RS_N_RESAMPLES, alpha=cfg.RS_ALPHA, seed=None,
+        processes=cfg.RS_PROCESSES):
+    ''' checks synchrony (r between turn-final and turn-initial chunks)
+
+    args:
+        df_bt: "big table" pandas dataframe as returned by ap.load_data
+        grp_by: array of constants from cfg.GRP_BYS (see ap.syn)
+    '''
+    cfg.check_grp_by(grp_by, [g for g in cfg.GRP_BYS
+                              if g != cfg.GRP_BY_SES_TYPE])
+    def __get_vals(df, f):
+        df = df[pd.notna(df[f]) & pd.notna(df[f + '_paired'])]
+        return (df[f].to_numpy(dtype=float),
+                df[f + '_paired'].to_numpy(dtype=float))
+    jobs, keys = _get_jobs(df_bt[df_bt['p_or_x'] == 'p'], grp_by, __get_vals,
+                           'corr', n_resamples, alpha, seed)
+    return aux.get_df(_run_all(jobs, keys, processes), _INDEX_NAMES)
+
+
+def lcon(df_bt, grp_by=[cfg.GRP_BY_SES, cfg.GRP_BY_SES_SPK],
+         n_resamples=cfg.RS_N_RESAMPLES, alpha=cfg.RS_ALPHA, seed=None,
+         processes=cfg.RS_PROCESSES):
+    ''' checks local convergence (r between similarity and start time)
+
+    args:
+        df_bt: "big table" pandas dataframe as returned by ap.load_data
+        grp_by: array of constants from cfg.GRP_BYS (see ap.lcon)
+    '''
+    cfg.check_grp_by(grp_by, [cfg.GRP_BY_SES, cfg.GRP_BY_SES_SPK])
+    def __get_vals(df, f):
+        # rows with nan values are excluded for the respective feature and all
+        # subsequent ones (cumulative filter, same sample as in ap.lcon)
+        cols = [g + '_sim' for g in cfg.FEATURES[:cfg.FEATURES.index(f)+1]]
+        df = df[pd.notna(df[cols]).all(axis=1) & pd.notna(df['start_time'])]
+        return (df[f + '_sim'].to_numpy(dtype=float),
+                df['start_time'].to_numpy(dtype=float))
+    jobs, keys = _get_jobs(df_bt[df_bt['p_or_x'] == 'p'], grp_by, __get_vals,
+                           'corr', n_resamples, alpha, seed)
+    return aux.get_df(_run_all(jobs, keys, processes), _INDEX_NAMES)
+
+
+def lsim(df_bt, grp_by=[cfg.GRP_BY_SES_TYPE, cfg.GRP_BY_SES],
+         n_resamples=cfg.RS_N_RESAMPLES, alpha=cfg.RS_ALPHA, seed=None,
+         processes=cfg.RS_PROCESSES):
+    ''' checks local similarity (mean of adjacent minus non-adjacent sims)
+
+    args:
+        df_bt: "big table" pandas dataframe as returned by ap.load_data
+        grp_by: array of constants from cfg.GRP_BYS (see ap.lsim)
+    '''
+    cfg.check_grp_by(grp_by)
+    # mean similarity per turn-initial chunk with adjacent and non-adjacent
+    # paired chunks, in one row per chunk (same as in ap.lsim)
+    grp_cols = ['ses_type', 'ses_id', 'tsk_id', 'spk_id', 'chu_id', 'p_or_x']
+    df_sims = df_bt.loc[:, grp_cols + ['%s_sim' % f for f in cfg.FEATURES]]
+    df_sims = df_sims.groupby(grp_cols).mean()
+    df_sims = pd.DataFrame(df_sims.xs('p', level=5)).join(
+        df_sims.xs('x', level=5), lsuffix='_p', rsuffix='_x').reset_index()
+    def __get_vals(df, f):
+        diffs = (df[f + '_sim_p'] - df[f + '_sim_x']).to_numpy(dtype=float)
+        return (diffs[~np.isnan(diffs)],)
+    jobs, keys = _get_jobs(df_sims, grp_by, __get_vals, 'mean', n_resamples,
+                           alpha, seed)
+    return aux.get_df(_run_all(jobs, keys, processes), _INDEX_NAMES)
+
+
+def gsim(df_gsim_raw, n_resamples=cfg.RS_N_RESAMPLES, alpha=cfg.RS_ALPHA,
+         seed=None, processes=cfg.RS_PROCESSES):
+    ''' checks global similarity (mean of partner minus non-partner sims)
+
+    args:
+        df_gsim_raw: second dataframe returned by ap.gsim (raw means)
+    returns:
+        results per session type as in ap.gsim (0 for all sessions)
+    '''
+    # session level samples with speaker (same as in ap.gsim)
+    df = df_gsim_raw.reset_index()
+    df = df[(df['tsk_id'] == 0) & (df['spk_id'] != 0)]
+    def __get_vals(df, f):
+        diffs = (df[f + '_sim_p'] - df[f + '_sim_x']).to_numpy(dtype=float)
+        return (diffs[~np.isnan(diffs)],)
+    # all session types together and each separately
+    df_all = df.assign(ses_type=0)
+    jobs, keys = _get_jobs(pd.concat([df_all, df]), [cfg.GRP_BY_SES_TYPE],
+                           __get_vals, 'mean', n_resamples, alpha, seed)
+    keys = [(f, key[0]) for f, key in keys]
+    return aux.get_df(_run_all(jobs, keys, processes), ['ses_type'])
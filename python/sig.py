@@ -0,0 +1,287 @@
+import numpy as np
+
+# this module contains in-process signal processing on arrays of audio samples
+# (floats between -1 and 1, mono), as an alternative to running external tools
+# on temporary files; analysis parameters mirror those in the praat scripts,
+# but the algorithms are simplified (e.g., no path finding for pitch), so
+# values differ somewhat from praat's (see fea.compare_backends)
+
+
+
+################################################################################
+#                               MODULE VARIABLES                               #
+################################################################################
+
+# pitch analysis (autocorrelation, "To Pitch... 0 75 600" in praat)
+_PITCH_MIN = 75.0
+_PITCH_MAX = 600.0
+_PITCH_STEP = 0.75 / _PITCH_MIN
+_PITCH_WIN = 3.0 / _PITCH_MIN
+_SILENCE_THRESH = 0.03
+_VOICING_THRESH = 0.45
+_OCTAVE_COST = 0.01
+
+# intensity analysis ("To Intensity... 100 0 no" in praat)
+_INT_MIN_PITCH = 100.0
+_INT_STEP = 0.8 / _INT_MIN_PITCH
+_INT_WIN = 3.2 / _INT_MIN_PITCH
+
+# jitter and shimmer ("Get jitter (local)... 0 0 0.0001 0.02 1.3" etc.)
+_PERIOD_FLOOR = 0.0001
+_PERIOD_CEILING = 0.02
+_MAX_PERIOD_FACTOR = 1.3
+_MAX_AMP_FACTOR = 1.6
+
+
+
+################################################################################
+#                        NON-PUBLIC AUXILIARY FUNCTIONS                        #
+################################################################################
+
+def _get_frames(samples, rate, win_dur, step_dur):
+    ''' cuts samples into frames, centered within the signal like in praat
+
+    returns:
+        2d array with one frame per row and array with frame midpoints (secs)
+    '''
+    win_len = int(round(win_dur * rate))
+    dur = len(samples) / rate
+    n_frames = int(np.floor((dur - win_dur) / step_dur + 1e-9)) + 1
+    if n_frames < 1 or win_len > len(samples):
+        return np.zeros((0, win_len)), np.zeros(0)
+    times = 0.5 * (dur - step_dur * (n_frames - 1)) \
+          + step_dur * np.arange(n_frames)
+    starts = np.round(times * rate - win_len / 2).astype(int)
+    starts = np.clip(starts, 0, len(samples) - win_len)
+    return samples[starts[:, None] + np.arange(win_len)], times
+
+
+def _get_pitch(samples, rate):
+    ''' computes autocorrelation-based pitch track for all frames at once
+
+    returns:
+        frame midpoints, f0 per frame (nan if unvoiced), autocorrelation peak
+        per frame (harmonic strength, used for nhr)
+    '''
+    frames, times = _get_frames(samples, rate, _PITCH_WIN, _PITCH_STEP)
+    if len(frames) == 0:
+        return times, np.zeros(0), np.zeros(0)
+    win_len = frames.shape[1]
+    frames = frames - frames.mean(axis=1, keepdims=True)
+    global_peak = np.max(np.abs(samples - samples.mean()))
+    local_peaks = np.max(np.abs(frames), axis=1)
+    # autocorrelation of windowed frames via fft, normalized by lag 0 and by
+    # the autocorrelation of the window itself (boersma 1993)
+    window = np.hanning(win_len)
+    n_fft = 1 << int(np.ceil(np.log2(2 * win_len)))
+    spec = np.fft.rfft(frames * window, n_fft, axis=1)
+    acs = np.fft.irfft(np.abs(spec) ** 2, n_fft, axis=1)[:, :win_len]
+    ac_win = np.fft.irfft(np.abs(np.fft.rfft(window, n_fft)) ** 2, n_fft)
+    ac_win = ac_win[:win_len] / ac_win[0]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        acs = acs / acs[:, :1] / ac_win
+    acs = np.nan_to_num(acs)
+    # candidates: local maxima within the allowed lag range
+    lag_min = max(int(np.floor(rate / _PITCH_MAX)), 1)
+    lag_max = min(int(np.ceil(rate / _PITCH_MIN)), win_len - 2)
+    lags = np.arange(lag_min, lag_max + 1)
+    r = acs[:, lags]
+    is_max = (r > acs[:, lags - 1]) & (r >= acs[:, lags + 1])
+    # octave cost favors higher frequencies (as in praat)
+    scores = r - _OCTAVE_COST * np.log2(_PITCH_MIN * lags / rate)
+    scores = np.where(is_max, scores, -np.inf)
+    best = np.argmax(scores, axis=1)
+    best_lags = lags[best]
+    # refine lag and peak height by parabolic interpolation
+    rows = np.arange(len(frames))
+    y0 = acs[rows, best_lags - 1]
+    y1 = acs[rows, best_lags]
+    y2 = acs[rows, best_lags + 1]
+    denom = y0 - 2 * y1 + y2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offsets = np.where(denom != 0, 0.5 * (y0 - y2) / denom, 0.0)
+    peaks = y1 - 0.25 * (y0 - y2) * offsets
+    # voicing decision like praat's unvoiced candidate strength
+    rel_peaks = local_peaks / global_peak if global_peak > 0 \
+        else np.zeros(len(frames))
+    unvoiced = _VOICING_THRESH + np.maximum(
+        0, 2 - rel_peaks / (_SILENCE_THRESH / (1 + _VOICING_THRESH)))
+    voiced = np.isfinite(scores[rows, best]) \
+           & (scores[rows, best] > unvoiced)
+    f0 = np.where(voiced, rate / (best_lags + offsets), np.nan)
+    return times, f0, np.clip(peaks, 0.0, 1.0)
+
+
+def _get_intensity(samples, rate):
+    ''' computes intensity contour (db spl) for all frames at once '''
+    frames, times = _get_frames(samples, rate, _INT_WIN, _INT_STEP)
+    if len(frames) == 0:
+        return times, np.zeros(0)
+    window = np.kaiser(frames.shape[1], 20)
+    power = (frames ** 2 * window).sum(axis=1) / window.sum()
+    # reference pressure 2e-5 pa
+    return times, 10 * np.log10(np.maximum(power, 1e-30) / 4e-10)
+
+
+def _refine_peaks(samples, idx):
+    ''' interpolates positions and heights of maxima of |samples| (parabolic)
+
+    args:
+        samples: numpy array of floats
+        idx: numpy array with indices of maxima of |samples|
+    returns:
+        numpy arrays with positions (in fractional samples) and heights
+    '''
+    y = np.abs(samples)
+    y0 = y[np.maximum(idx - 1, 0)]
+    y1 = y[idx]
+    y2 = y[np.minimum(idx + 1, len(y) - 1)]
+    denom = y0 - 2 * y1 + y2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        offsets = np.where(denom < 0, 0.5 * (y0 - y2) / denom, 0.0)
+    # maxima at the edge of a search range need not be local maxima
+    offsets = np.clip(offsets, -0.5, 0.5)
+    return idx + offsets, y1 - 0.25 * (y0 - y2) * offsets
+
+
+def _get_pulses(samples, rate, times, f0):
+    ''' finds glottal pulses in each stretch of voiced frames
+
+    like praat's PointProcess, pulses are placed at interpolated maxima, so
+    periods are not quantized to whole samples
+
+    returns:
+        list of (positions, amplitudes) tuples of arrays, one per stretch, with
+        positions in (fractional) samples
+    '''
+    voiced = ~np.isnan(f0)
+    edges = np.diff(np.concatenate([[0], voiced.astype(int), [0]]))
+    runs = zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1))
+    pulses = []
+    for s, e in runs:
+        i_start = max(int((times[s] - _PITCH_STEP / 2) * rate), 0)
+        i_end = min(int((times[e-1] + _PITCH_STEP / 2) * rate), len(samples))
+        # first pulse at absolute maximum within first period, subsequent
+        # pulses at absolute maximum around one local period later
+        period = rate / f0[s]
+        i = i_start + int(np.argmax(np.abs(
+            samples[i_start:min(i_start + int(period) + 1, i_end)])))
+        run_pulses = [i]
+        while True:
+            period = rate / np.interp(i / rate, times[s:e], f0[s:e])
+            lo = i + int(0.8 * period)
+            hi = i + int(1.25 * period) + 1
+            if hi > i_end:
+                break
+            i = lo + int(np.argmax(np.abs(samples[lo:hi])))
+            run_pulses += [i]
+        pulses += [_refine_peaks(samples, np.array(run_pulses))]
+    return pulses
+
+
+def _get_jitter_shimmer(rate, pulses):
+    ''' computes local jitter and shimmer from given pulses (praat style) '''
+    diffs_t, periods, diffs_a, amps = [], [], [], []
+    for positions, amplitudes in pulses:
+        if len(positions) < 3:
+            continue
+        t = np.diff(positions) / rate
+        a = amplitudes[1:]
+        ok = (t >= _PERIOD_FLOOR) & (t <= _PERIOD_CEILING)
+        periods += [t[ok]]
+        amps += [a[ok]]
+        # consecutive periods only count if both valid and similar enough
+        ok2 = ok[1:] & ok[:-1] \
+            & (np.maximum(t[1:], t[:-1])
+               <= _MAX_PERIOD_FACTOR * np.minimum(t[1:], t[:-1]))
+        diffs_t += [np.abs(np.diff(t))[ok2]]
+        ok3 = ok2 & (np.maximum(a[1:], a[:-1])
+                     <= _MAX_AMP_FACTOR * np.minimum(a[1:], a[:-1]))
+        diffs_a += [np.abs(np.diff(a))[ok3]]
+    if len(periods) == 0:
+        return None, None
+    periods = np.concatenate(periods)
+    amps = np.concatenate(amps)
+    diffs_t = np.concatenate(diffs_t)
+    diffs_a = np.concatenate(diffs_a)
+    jitter = diffs_t.mean() / periods.mean() \
+        if len(diffs_t) > 0 and len(periods) > 0 else None
+    shimmer = diffs_a.mean() / amps.mean() \
+        if len(diffs_a) > 0 and amps.mean() > 0 else None
+    return jitter, shimmer
+
+
+def _round(val, digits=3):
+    ''' rounds like praat output (see extract_features.praat), keeps None '''
+    if val is None or not np.isfinite(val):
+        return None
+    return round(float(val), digits)
+
+
+
+################################################################################
+#                               PUBLIC FUNCTIONS                               #
+################################################################################
+
+def get_energies(samples, frame_len):
+    ''' computes mean squared amplitude of consecutive frames
+
+    frames do not overlap and a trailing partial frame is dropped, same as
+    opensmile's framer and energy components in smile/energy.conf
+
+    args:
+        samples: numpy array of floats (mono, between -1 and 1)
+        frame_len: number of samples per frame
+    returns:
+        numpy array with one energy value per frame
+    '''
+    n_frames = len(samples) // frame_len
+    frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len)
+    return np.einsum('ij,ij->i', frames, frames) / frame_len
+
+
+def get_features(samples, rate):
+    ''' computes acoustic-prosodic features for given samples
+
+    args:
+        samples: numpy array of floats (mono, between -1 and 1)
+        rate: sample rate
+    returns:
+        dictionary with same keys as output of praat feature extraction
+        (see cfg.FEATURE_KEYS), values None where undefined
+    '''
+    dur = len(samples) / rate
+    features = {'dur': _round(dur)}
+    # pitch and voicing
+    times, f0, peaks = _get_pitch(samples, rate)
+    voiced = ~np.isnan(f0)
+    n_vcd = int(voiced.sum())
+    f0_vcd = f0[voiced]
+    features['f0_min'] = _round(f0_vcd.min()) if n_vcd > 0 else None
+    features['f0_max'] = _round(f0_vcd.max()) if n_vcd > 0 else None
+    features['f0_mean'] = _round(f0_vcd.mean()) if n_vcd > 0 else None
+    features['f0_std'] = _round(f0_vcd.std(ddof=1)) if n_vcd > 1 else None
+    features['vcd2tot_frames'] = _round(n_vcd / len(f0)) \
+        if len(f0) > 0 else None
+    # intensity (only for chunks long enough, see praat script)
+    if dur > 6.4 / 100.0:
+        _, ints = _get_intensity(samples, rate)
+    else:
+        ints = np.zeros(0)
+    features['int_min'] = _round(ints.min()) if len(ints) > 0 else None
+    features['int_max'] = _round(ints.max()) if len(ints) > 0 else None
+    features['int_mean'] = _round(10 * np.log10(np.mean(10 ** (ints / 10)))) \
+        if len(ints) > 0 else None
+    features['int_std'] = _round(ints.std(ddof=1)) if len(ints) > 1 else None
+    # noise-to-harmonics ratio from harmonic strength of voiced frames
+    with np.errstate(divide='ignore', invalid='ignore'):
+        nhrs = (1 - peaks[voiced]) / peaks[voiced]
+    features['nhr'] = _round(np.mean(nhrs), 6) if n_vcd > 0 else None
+    # jitter and shimmer, only for enough voiced speech (see praat script)
+    jitter, shimmer = None, None
+    if n_vcd * _PITCH_STEP > 6.4 / _PITCH_MIN:
+        pulses = _get_pulses(samples, rate, times, f0)
+        jitter, shimmer = _get_jitter_shimmer(rate, pulses)
+    features['jitter'] = _round(jitter, 6)
+    features['shimmer'] = _round(shimmer, 6)
+    return features
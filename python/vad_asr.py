@@ -1,13 +1,17 @@
-import collections
-import json
+import multiprocessing
+import numpy as np
 import os
 import re
 import sqlite3
 import subprocess
+import time
 
 import cfg
 import db
 import fio
+import rec
+import sig
+import wav
 
 # this module contains functions for voice activity detection and 
 # automatic speech recognition in all collected audio files
@@ -19,10 +23,11 @@ import fio
 ################################################################################
 
 def _run_smile(wav_path, wav_fname):
-    ''' runs opensmile to identify sounding frames for given audio '''
-    sound_threshold = 0.000001
-    frame_size = 0.01
-    frame_step = 0.01
+    ''' runs opensmile to identify sounding frames for given audio
+
+    returns:
+        boolean numpy array, whether each 10ms frame is sounding
+    '''
     csv_fname = wav_fname[:-3] + 'csv'
     # get energy values for all frames in the given wav file
     subprocess.check_call(
@@ -30,111 +35,130 @@ def _run_smile(wav_path, wav_fname):
          '-C', '../smile/energy.conf', 
          '-I', wav_path + wav_fname, 
          '-csvoutput', cfg.TMP_PATH + csv_fname])
-    # read csv and store timestamps and silence vs. sound in list
-    frames = []
+    # read csv and store silence vs. sound per frame
     with open(cfg.TMP_PATH + csv_fname) as file:
-        for i, line in enumerate(file):
-            frames += [(round(i * frame_step, 2), 
-                        round(i * frame_step + frame_size, 2),
-                        float(line) > sound_threshold)]
+        frames = np.array([float(line) > cfg.VAD_SOUND_THRESH
+                           for line in file])
     os.remove(cfg.TMP_PATH + csv_fname)
     return frames
 
 
-def _run_praat_prepend_silence(wav_path, wav_fname, sil_dur):
-    ''' runs a praat script to prepend silence to a wav file '''
-    # (initial silence was observed to improve asr accuracy)
-    subprocess.check_call([
-        'praat', '--run', '../praat/prepend_silence.praat',
-        wav_path + wav_fname, wav_path + wav_fname, str(sil_dur)])
+def _run_numpy(wav_path, wav_fname):
+    ''' computes frame energies in-process to identify sounding frames
 
+    same frames and energies as _run_smile (see smile/energy.conf), but read
+    block by block from the memory-mapped wav file, without external process
+    or csv file
 
-def _run_watson(cut_path, cut_fname, json_path, json_fname, dur):
-    ''' runs watson asr on given audio slice '''
-    # send segment to watson
-    subprocess.check_call(
-        ['curl', 
-         '-X', 'POST', 
-         '-u', 'apikey:' + cfg.API_KEY,
-         '--header', 'Content-Type: audio/wav',
-         '--data-binary', '@' + cut_path + cut_fname,
-         cfg.API_URL + cfg.API_INS + 'v1/recognize?timestamps=true',
-        '-o', json_path + json_fname])
-    # process response
-    with open(json_path + json_fname) as response:
-        obj = json.loads(response.read())
-    try:
-        trans = obj['results'][0]['alternatives'][0]['transcript']
-        trans = trans[:-1]
-        ts = obj['results'][0]['alternatives'][0]['timestamps']
-    except IndexError:
-        trans = ''
-        ts = [['', 0.0, dur]]
-    os.remove(json_path + json_fname)
-    return trans, ts
-
-
-def _get_intervals(frames):
-    ''' aggregates short frames into intervals of silence/sound '''
+    returns:
+        boolean numpy array, whether each 10ms frame is sounding
+    '''
+    wav_file = wav.open_wav(wav_path, wav_fname, cache=False)
+    frame_len = int(round(cfg.VAD_FRAME_DUR * wav_file.rate))
+    frames = np.zeros(len(wav_file) // frame_len, dtype=bool)
+    i = 0
+    for samples in wav_file.iter_samples(frame_len * cfg.VAD_BLOCK_FRAMES):
+        energies = sig.get_energies(samples, frame_len)
+        frames[i:i+len(energies)] = energies > cfg.VAD_SOUND_THRESH
+        i += len(energies)
+    return frames
+
+
+def _get_run_lengths(flags):
+    ''' returns length of the run of true values ending at each position '''
+    idx = np.arange(len(flags))
+    # position of the last false value up to each position (-1 if none)
+    last_false = np.maximum.accumulate(np.where(flags, -1, idx))
+    return idx - last_false
+
+
+def _get_intervals(frames, frame_size=0.01, frame_step=0.01):
+    ''' aggregates short frames into intervals of silence/sound
+
+    args:
+        frames: boolean numpy array, whether each frame is sounding
+        frame_size, frame_step: frame duration and shift (in seconds)
+    returns:
+        list of [start, end, label] intervals
+    '''
     # ring buffer algorithm adapted from 
     # https://github.com/wiseman/py-webrtcvad/blob/master/example.py
+    # the buffer is not simulated frame by frame; instead, the next frame at
+    # which the state switches is looked up using counts and run lengths of
+    # sounding/silent frames computed once for all frames
     get_label = lambda is_sounding: \
         'sounding' if is_sounding else 'silent'
-    buf = collections.deque(maxlen=20)
+    get_start = lambda i: round(int(i) * frame_step, 2)
+    get_end = lambda i: round(int(i) * frame_step + frame_size, 2)
+    buf_maxlen = 20
+    n = len(frames)
+    idx = np.arange(n)
+    # number of sounding frames before each position
+    cnts = np.concatenate([[0], np.cumsum(frames)])
+    run_snd = _get_run_lengths(frames)
+    run_sil = _get_run_lengths(~frames)
+    # frames at which a full buffer switches to sound (most frames in buffer
+    # or last five are sounding) or to silence (last five are silent)
+    cnts_full = cnts[idx + 1] - cnts[np.maximum(idx + 1 - buf_maxlen, 0)]
+    to_snd = np.flatnonzero((cnts_full >= 0.7 * buf_maxlen) | (run_snd > 4))
+    to_sil = np.flatnonzero(run_sil > 4)
+
     in_sound_interval = False
     intervals = [[0.0, 0.0, get_label(False)]]
-    for frame in frames:
+    # first frame in buffer after it was last cleared
+    s = 0
+    while s < n:
         if not in_sound_interval:
-            buf.append(frame)
-            # number of sounding frames in buffer
-            cnt_snd = len([f for f in buf if f[2]])
-            # position of last silent frame in buffer (0 if none)
-            max_sil = max([i + 1 for i, f in enumerate(buf) 
-                           if not f[2]] + [0])
-            # position of first sounding frame in buffer
-            # (or buf.maxlen+1 if there are none)
-            min_snd = min([i + 1 for i, f in enumerate(buf) 
-                           if f[2]] + [buf.maxlen+1])
-            
-            if (cnt_snd >= 0.7 * buf.maxlen) \
-            or (len(buf) - max_sil > 4):
-                # most frames in buffer or last five are sounding
-                # -> switch state
-                in_sound_interval = True
-                if cnt_snd != len(buf):
-                    intervals[-1][1] = buf[min_snd-1][0]
-                elif len(intervals) == 1:
-                    # audio begins with sounding interval, 
-                    # remove empty initial silent interval
-                    intervals = []
-                intervals += [[buf[min_snd-1][0],
-                               buf[-1][1],
-                               get_label(True)]]
-                buf.clear()
+            # while buffer is not full, counts are limited to frames since s
+            ks = np.arange(s, min(s + buf_maxlen - 1, n))
+            cnt_snd = cnts[ks + 1] - cnts[s]
+            hits = (cnt_snd >= 0.7 * buf_maxlen) \
+                 | (np.minimum(run_snd[ks], ks - s + 1) > 4)
+            if hits.any():
+                k = ks[np.argmax(hits)]
+            else:
+                j = np.searchsorted(to_snd, s + buf_maxlen - 1)
+                if j == len(to_snd):
+                    break
+                k = to_snd[j]
+            # switch state; buffer holds frames b0 through k
+            in_sound_interval = True
+            b0 = max(s, k - buf_maxlen + 1)
+            min_snd = b0 + np.argmax(frames[b0:k+1])
+            if cnts[k+1] - cnts[b0] != k - b0 + 1:
+                intervals[-1][1] = get_start(min_snd)
+            elif len(intervals) == 1:
+                # audio begins with sounding interval, 
+                # remove empty initial silent interval
+                intervals = []
+            intervals += [[get_start(min_snd), get_end(k), get_label(True)]]
         else:
-            buf.append(frame)
-            # number of silent frames in buffer
-            cnt_sil = len([f for f in buf if not f[2]])
-            # position of last sounding frame in buffer (0 if none)
-            max_snd = max([i + 1 for i, f in enumerate(buf) 
-                           if f[2]] + [0])
             # switch state if last 5 in buffer are silent 
-            if len(buf) - max_snd > 4:
-                in_sound_interval = False
-                if cnt_sil != len(buf):
-                    intervals[-1][1] = buf[max_snd-1][1]
-                    intervals += [[buf[max_snd-1][1],
-                                   buf[-1][1],
-                                   get_label(False)]]
-                else:
-                    intervals += [[buf[0][0],
-                                   buf[-1][1],
-                                   get_label(False)]]
-                buf.clear()
-    intervals[-1][1] = frames[-1][1]
+            j = np.searchsorted(to_sil, s + 4)
+            if j == len(to_sil):
+                break
+            k = to_sil[j]
+            in_sound_interval = False
+            b0 = max(s, k - buf_maxlen + 1)
+            if cnts[k+1] - cnts[b0] != 0:
+                max_snd = k - np.argmax(frames[b0:k+1][::-1])
+                intervals[-1][1] = get_end(max_snd)
+                intervals += [[get_end(max_snd), get_end(k), get_label(False)]]
+            else:
+                intervals += [[get_start(b0), get_end(k), get_label(False)]]
+        # buffer is cleared after each switch
+        s = k + 1
+    intervals[-1][1] = get_end(n - 1)
     return intervals
 
 
+def _run_round(job):
+    ''' runs vad or asr for a single machine's round (see do_all) '''
+    func, ses_id, grp_id, mch_id, rnd, wav_path, wav_fname = job
+    t = func(grp_id, mch_id, rnd, wav_path, wav_fname)
+    return ses_id, grp_id, mch_id, rnd, t
+
+
 def _preprocess_words(words):
     ''' preprocesses transcriptions to make them consistent '''
     words = words.lower()
@@ -164,17 +188,33 @@ def _preprocess_words(words):
 #                               PUBLIC FUNCTIONS                               #
 ################################################################################s
 
-def vad(grp_id, mch_id, rnd, wav_path, wav_fname):
-    ''' runs simple, energy-based vad for given machine's round '''
+def vad(grp_id, mch_id, rnd, wav_path, wav_fname, backend=cfg.VAD_BACKEND):
+    ''' runs simple, energy-based vad for given machine's round
+
+    args:
+        backend: how to compute frame energies (see cfg.VAD_BACKENDS)
+    '''
+    cfg.check_vad_backend(backend)
     vad_path, vad_fname = fio.get_vad_pfn(wav_fname)
-    frames = _run_smile(wav_path, wav_fname)    
-    intervals = _get_intervals(frames)
+    if backend == cfg.VAD_BACKEND_SMILE:
+        frames = _run_smile(wav_path, wav_fname)
+    else:
+        frames = _run_numpy(wav_path, wav_fname)
+    intervals = _get_intervals(frames, cfg.VAD_FRAME_DUR, cfg.VAD_FRAME_DUR)
     fio.write_textgrid_file(vad_path, vad_fname, intervals)
     return sum([s[1] - s[0] for s in intervals if s[2] == 'sounding'])
 
 
-def asr(grp_id, mch_id, rnd, wav_path, wav_fname):
-    ''' runs watson asr for given machine's round '''
+def asr(grp_id, mch_id, rnd, wav_path, wav_fname, recognizer=None):
+    ''' runs asr for given machine's round (watson unless specified)
+
+    all sounding intervals are cut first, then transcribed concurrently
+
+    args:
+        recognizer: rec.Recognizer to use (rec.WatsonRecognizer if None)
+    '''
+    if recognizer is None:
+        recognizer = rec.WatsonRecognizer()
     # manually corrected vad file with sounding intervals to transcribe
     vad_path, vad_fname = fio.get_vad_pfn(wav_fname, 'corrected/')
     # directory to store cut wav files
@@ -187,32 +227,37 @@ def asr(grp_id, mch_id, rnd, wav_path, wav_fname):
         raise ValueError(msg)
     
     in_intervals = fio.read_textgrid_file(vad_path, vad_fname)
+    # extract audio segments from (mapped) input wav file, with silence
+    # prepended (initial silence was observed to improve asr accuracy)
+    wav_file = wav.open_wav(wav_path, wav_fname)
+    sil_dur = 0.1
+    sil = np.zeros((int(round(sil_dur * wav_file.rate)), wav_file.channels),
+                   dtype=wav_file.dtype)
+    segments = []
+    for xmin, xmax, text in in_intervals:
+        if text == 'silent':
+            continue
+        # enumerate manually because only non-empty intervals count
+        cut_fname = str(len(segments) + 1) + '.wav'
+        wav.write_frames(
+            cut_path, cut_fname,
+            np.concatenate([sil, wav_file.get_frames(xmin, xmax)]),
+            wav_file.rate)
+        segments += [(cut_path + cut_fname, xmax - xmin + sil_dur)]
+    # get asr transcripts for all segments
+    results = iter(rec.recognize_all(recognizer, segments))
+    
     out_intervals = []
     out_alignments = []
     asr_total_time = 0.0
-    i = 0
     for xmin, xmax, text in in_intervals:
         if text == 'silent':
             # no transcription needed for silent intervals
             out_intervals += [[xmin, xmax, '<silence>']]
             out_alignments += [[xmin, xmax, '<silence>']]
             continue
-        # enumerate manually because only non-empty intervals count
-        i += 1 
-        cut_fname = str(i) + '.wav'
-        # extract audio segment from input wav file
-        subprocess.check_call(
-            ['sox', wav_path + wav_fname, cut_path + cut_fname, 
-             'trim', str(xmin), '=' + str(xmax)])
-        # prepend silence (improves transcription accuracy)
-        sil_dur = 0.1
-        _run_praat_prepend_silence(cut_path, cut_fname, sil_dur)
-        # get asr transcript from watson
-        json_fname = wav_fname[:-4] + '_' + str(i) + '.json'
-        dur = xmax - xmin + sil_dur
-        trans, ts = _run_watson(
-            cut_path, cut_fname, cfg.TMP_PATH, json_fname, dur)
-        asr_total_time += dur
+        trans, ts = next(results)
+        asr_total_time += xmax - xmin + sil_dur
         # store interval, without and with alignment (timestamps)
         out_intervals += [[xmin, xmax, trans]]
         out_alignments += [[round(xmin + max(0.0, v[1] - sil_dur), 2), 
@@ -228,8 +273,18 @@ def asr(grp_id, mch_id, rnd, wav_path, wav_fname):
     return asr_total_time
 
 
-def do_all(func):
-    ''' runs given function for all sessions of certain status '''
+def do_all(func, processes=cfg.DO_ALL_PROCESSES):
+    ''' runs given function for all sessions of certain status
+
+    machine rounds are processed by a pool of worker processes; only the main
+    process writes to the database, committing the status of each session as
+    soon as all its rounds are done, so interrupted runs can be restarted
+
+    args:
+        func: vad or asr
+        processes: number of worker processes (None for one per cpu core, 1
+            to run everything in the main process)
+    '''
     if func == vad:
         status = 1
     elif func == asr:
@@ -237,21 +292,57 @@ def do_all(func):
     else:
         raise ValueError('unsupported function for do_all')
 
-    total_time = 0.0
-    for grp_id, ses_id, ses_type, rnd, mch_pair in db.find_sessions(status):
+    # collect all rounds first, statuses change while processing
+    jobs = []
+    n_open = {}
+    for grp_id, ses_id, ses_type, rnd, mch_pair \
+    in list(db.find_sessions(status)):
+        n_open[ses_id] = 0
         for mch_id, wav_path, wav_fname in mch_pair:
             if mch_id == 0:
                 continue
-            total_time += func(grp_id, mch_id, rnd, wav_path, wav_fname)
-            print(grp_id, mch_id, rnd, 'done')
+            jobs += [(func, ses_id, grp_id, mch_id, rnd, wav_path, wav_fname)]
+            n_open[ses_id] += 1
+    for ses_id in [ses_id for ses_id, n in n_open.items() if n == 0]:
         db.set_ses_status(ses_id, status+1)
+    db.commit()
+
+    pool = multiprocessing.Pool(processes) if processes != 1 else None
+    results = pool.imap_unordered(_run_round, jobs) if pool \
+        else map(_run_round, jobs)
+    total_time = 0.0
+    cnt = 0
+    t0 = time.time()
+    try:
+        for ses_id, grp_id, mch_id, rnd, t in results:
+            total_time += t
+            cnt += 1
+            n_open[ses_id] -= 1
+            if n_open[ses_id] == 0:
+                db.set_ses_status(ses_id, status+1)
+                db.commit()
+            secs = time.time() - t0
+            print(grp_id, mch_id, rnd, 'done (%d/%d, %.1f per min, eta %.1f '
+                  'min)' % (cnt, len(jobs), cnt / secs * 60,
+                            (len(jobs) - cnt) * secs / cnt / 60))
+    finally:
+        if pool:
+            pool.terminate()
+            pool.join()
     print(total_time)
 
 
 def load_transcriptions():
-    ''' loads asr and final transcriptions into the database for all chunks '''
+    ''' loads asr and final transcriptions into the database for all chunks
+
+    chunks are matched by timestamps, using one lookup per speaker and round;
+    all lines are checked first and any that match no chunk or several are
+    reported together, in which case nothing is written
+    '''
+    words = []
+    errors = []
     # loop through all folders in the wav directory
-    for dname in os.listdir(cfg.WAV_PATH):
+    for dname in sorted(os.listdir(cfg.WAV_PATH)):
         # filter for grp_mch_rnd format (i.e., exclude "ses..." folders etc.)
         if not re.match('\d_\d_\d', dname):
             continue
@@ -268,19 +359,31 @@ def load_transcriptions():
             raise ValueError(err_str)
 
         # loop through transcripts for all chunks
+        chu_ids = db.get_chu_ids_by_times(grp_id, mch_id, rnd)
         for i, line in enumerate(lines_asr):
             ts1_asr, ts2_asr, words_asr = line.split('\t')
             ts1_fin, ts2_fin, words_fin = lines_fin[i].split('\t')
             # sanity check the data
             if ts1_asr != ts1_fin or ts2_asr != ts2_fin:
                 err_str = 'Mismatched timestamps for ASR and final ' \
-                    'transcriptions for line ' + i + ' in ' + dname
+                    'transcriptions for line ' + str(i) + ' in ' + dname
                 raise ValueError(err_str)
             
-            # update words_asr and words for chunk corresponding to this line
-            db.set_words(grp_id, mch_id, rnd, 
-                         float(ts1_asr), float(ts2_asr),
-                         _preprocess_words(words_fin), words_asr)
+            # find chunk corresponding to this line
+            ids = chu_ids.get((float(ts1_asr), float(ts2_asr)), [])
+            if len(ids) != 1:
+                errors += ['%s line %d (%s-%s): %s' % (
+                    dname, i, ts1_asr, ts2_asr,
+                    'no chunk found' if len(ids) == 0
+                    else 'multiple chunks found')]
+                continue
+            words += [(ids[0], _preprocess_words(words_fin), words_asr)]
+
+    if len(errors) > 0:
+        raise ValueError('%d transcript lines without unique chunk:\n%s'
+                         % (len(errors), '\n'.join(errors)))
+    # update words_asr and words for all chunks at once
+    db.set_words_bulk(words)
 
 
 
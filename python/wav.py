@@ -0,0 +1,137 @@
+import collections
+import numpy as np
+import os
+import struct
+import wave
+
+import cfg
+
+# this module provides memory-mapped access to wav files; each (session) file
+# is mapped once and sections of it are served as numpy views, so no audio is
+# copied or written to tmp files unless an external tool needs a file
+
+
+
+################################################################################
+#                               MODULE VARIABLES                               #
+################################################################################
+
+# mapped files by full path and file name, least recently used first
+_cache = collections.OrderedDict()
+
+
+
+################################################################################
+#                                WAV FILE CLASS                                #
+################################################################################
+
+class WavFile(object):
+    ''' memory-mapped pcm wav file with sample-exact access by timestamps '''
+    def __init__(self, pfn):
+        self.pfn = pfn
+        with open(pfn, 'rb') as file:
+            riff, _, wave_id = struct.unpack('<4sI4s', file.read(12))
+            if riff != b'RIFF' or wave_id != b'WAVE':
+                raise ValueError('not a wav file: ' + pfn)
+            # walk chunks until data chunk, reading format on the way
+            fmt = None
+            while True:
+                header = file.read(8)
+                if len(header) < 8:
+                    raise ValueError('no data chunk in wav file: ' + pfn)
+                chunk_id, size = struct.unpack('<4sI', header)
+                if chunk_id == b'fmt ':
+                    fmt = struct.unpack('<HHIIHH', file.read(16))
+                    file.seek(size - 16 + size % 2, os.SEEK_CUR)
+                elif chunk_id == b'data':
+                    offset = file.tell()
+                    break
+                else:
+                    file.seek(size + size % 2, os.SEEK_CUR)
+        if fmt is None:
+            raise ValueError('no format chunk in wav file: ' + pfn)
+        tag, self.channels, self.rate, _, _, bits = fmt
+        # plain pcm or extensible format, integer samples only
+        if tag not in [1, 0xFFFE] or bits not in [16, 32]:
+            raise ValueError('unsupported wav format in ' + pfn)
+        self.width = bits // 8
+        self.dtype = np.dtype('<i%d' % self.width)
+        # (size in header can be too large for files that were not closed)
+        size = min(size, os.path.getsize(pfn) - offset)
+        n_frames = size // (self.width * self.channels)
+        self._data = np.memmap(
+            pfn, dtype=self.dtype, mode='r', offset=offset,
+            shape=(n_frames, self.channels))
+
+    def __len__(self):
+        return len(self._data)
+
+    def get_index(self, ts):
+        ''' returns index of the sample at given timestamp (as in sox trim) '''
+        return min(int(round(ts * self.rate)), len(self._data))
+
+    def get_frames(self, start=0.0, end=None):
+        ''' returns raw frames between timestamps as view (no copy) '''
+        i_end = len(self._data) if end is None else self.get_index(end)
+        return self._data[self.get_index(start):i_end]
+
+    def _to_samples(self, frames):
+        ''' converts raw frames to floats (mono mixdown, -1 to 1) '''
+        samples = frames[:, 0] if self.channels == 1 else frames.mean(axis=1)
+        return samples / float(2 ** (8 * self.width - 1))
+
+    def get_samples(self, start=0.0, end=None):
+        ''' returns samples between timestamps as floats (mono, -1 to 1) '''
+        return self._to_samples(self.get_frames(start, end))
+
+    def iter_samples(self, block_len):
+        ''' yields all samples as floats (mono, -1 to 1) in blocks
+
+        only one block at a time is read into memory, regardless of file size
+
+        args:
+            block_len: number of samples per block (last one may be shorter)
+        '''
+        for i in range(0, len(self._data), block_len):
+            yield self._to_samples(self._data[i:i+block_len])
+
+    def write(self, path, fname, start=0.0, end=None):
+        ''' writes section between timestamps to a new wav file '''
+        write_frames(path, fname, self.get_frames(start, end), self.rate)
+
+
+
+################################################################################
+#                               PUBLIC FUNCTIONS                               #
+################################################################################
+
+def open_wav(path, fname, cache=True):
+    ''' returns memory-mapped wav file, mapping it only once if cached
+
+    files that change (e.g., turn audio) should not be cached
+    '''
+    pfn = path + fname
+    if not cache:
+        return WavFile(pfn)
+    if pfn in _cache:
+        _cache.move_to_end(pfn)
+    else:
+        _cache[pfn] = WavFile(pfn)
+        # each mapping holds a file handle, limit how many are open at once
+        while len(_cache) > cfg.WAV_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return _cache[pfn]
+
+
+def close_all():
+    ''' releases all cached memory-mapped files '''
+    _cache.clear()
+
+
+def write_frames(path, fname, frames, rate):
+    ''' writes given raw frames (2d array, one column per channel) to wav '''
+    with wave.open(path + fname, 'wb') as file:
+        file.setnchannels(frames.shape[1])
+        file.setsampwidth(frames.dtype.itemsize)
+        file.setframerate(rate)
+        file.writeframes(np.ascontiguousarray(frames).tobytes())
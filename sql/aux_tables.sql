@@ -5,96 +5,94 @@
 -- chunk having been completed or another chunk from the same speaker existing 
 -- right before that previous one
 -- note: 
---     selection of non-adjacent turn exchanges involves randomness so results
---     for local similarity will change if this is run multiple times;
+--     this script only inserts adjacent pairs; non-adjacent turn exchanges are
+--     sampled afterwards with a seed (run via chp.py, not this script alone);
+--     pairs are (re)computed only for sessions in temporary table chp_sessions
+--     (filled by chp.py), pairs of all other sessions are kept as they are;
+--     chp.py records in chunk_pair_stamps which chunk data the pairs of each
+--     session were computed from, to find sessions that need an update;
 --     code assumes continuous timestamps per session, no reset per task!
 
 
 
 DROP TABLE IF EXISTS consecutive_2_chunks;
 DROP TABLE IF EXISTS consecutive_3_chunks;
-DROP TABLE IF EXISTS tmp;
-DROP TABLE IF EXISTS tmp2;
-DROP TABLE IF EXISTS tmp3;
-DROP TABLE IF EXISTS chunk_pairs;
+
+CREATE TABLE IF NOT EXISTS chunk_pairs (
+    -- adjacent ('p') or non-adjacent ('x') pair
+    p_or_x         TEXT NOT NULL,
+    -- session of both chunks
+    ses_id         INTEGER NOT NULL,
+    -- turn-final (or almost turn-final) chunk
+    chu_id1        INTEGER NOT NULL,
+    -- turn-initial chunk
+    chu_id2        INTEGER NOT NULL,
+    -- position in random order among non-adjacent pairs of chu_id2 (from 0)
+    rid            INTEGER
+);
+
+-- composite indexes to read chunks in order (also created in init_bmic.sql,
+-- repeated here for databases created before they were added)
+CREATE INDEX IF NOT EXISTS tur_tsk_ord ON turns (tsk_id, turn_index);
+CREATE INDEX IF NOT EXISTS chu_tur_ord ON chunks (tur_id, chunk_index);
+
+CREATE INDEX IF NOT EXISTS chp_chu_fk1 ON chunk_pairs (chu_id1);
+CREATE INDEX IF NOT EXISTS chp_chu_fk2 ON chunk_pairs (chu_id2);
+CREATE INDEX IF NOT EXISTS chp_ses_fk ON chunk_pairs (ses_id);
+
+CREATE TABLE IF NOT EXISTS chunk_pair_stamps (
+    -- session with up-to-date chunk pairs
+    ses_id         INTEGER NOT NULL,
+    -- seed and checksum of chunk data (see db.get_chp_input_stamps)
+    stamp          TEXT NOT NULL,
+    PRIMARY KEY (ses_id)
+);
+
+DELETE FROM chunk_pairs
+WHERE  ses_id IN (SELECT ses_id FROM chp_sessions);
 
 
 
 CREATE TABLE consecutive_2_chunks
 -- pairs of consecutive chunks with meta-data
 AS
-WITH chu_last AS
-(
- -- id for all chunks which are last in their turn
- SELECT chu.chu_id
- FROM   chunks chu
- JOIN   turns tur
- ON     chu.tur_id == tur.tur_id
- WHERE  NOT EXISTS (
-                    SELECT 1
-                    FROM   chunks chu2
-                    JOIN   turns tur2
-                    ON     chu2.tur_id == tur2.tur_id
-                    WHERE  tur.tsk_id == tur2.tsk_id
-                    AND    tur.turn_index == tur2.turn_index
-                    AND    chu.chunk_index < chu2.chunk_index
-                   )
-),
-tur_last AS
+WITH tur AS
 (
- -- id for all turns which are last in their task
- SELECT tur.tur_id
+ -- turns of selected sessions with flag for turns which are last in their task
+ -- (turns without chunks count as well)
+ SELECT tur.tur_id,
+        tur.tsk_id,
+        tur.turn_index,
+        tur.speaker_role,
+        tur.a_or_b,
+        tur.spk_id,
+        CASE
+            WHEN tur.turn_index == MAX(tur.turn_index)
+                                   OVER (PARTITION BY tur.tsk_id)
+            THEN 1
+            ELSE 0
+        END is_last_turn
  FROM   turns tur
- WHERE  NOT EXISTS (
-                    SELECT 1
-                    FROM   turns tur2
-                    WHERE  tur.tsk_id == tur2.tsk_id
-                    AND    tur.turn_index < tur2.turn_index
-                   )
-), 
+ JOIN   tasks tsk
+ ON     tur.tsk_id == tsk.tsk_id
+ WHERE  tsk.ses_id IN (SELECT ses_id FROM chp_sessions)
+),
 chu AS
 (
  SELECT chu.chu_id,
         tur.tur_id,
         tsk.tsk_id,
-        ses.ses_id,
-        CASE 
-            WHEN tur.speaker_role == 'd' AND tsk.a_or_b == 'A'
-            THEN spk_a.spk_id
-            WHEN tur.speaker_role == 'f' AND tsk.a_or_b == 'B'
-            THEN spk_a.spk_id
-            ELSE spk_b.spk_id
-        END spk_id,
+        tsk.ses_id,
+        tur.spk_id,
         chu.chunk_index,
         tur.turn_index,
         tsk.task_index,
         tur.speaker_role,
-        CASE 
-            WHEN tur.speaker_role == 'd' AND tsk.a_or_b == 'A'
-            THEN 'A'
-            WHEN tur.speaker_role == 'f' AND tsk.a_or_b == 'B'
-            THEN 'A'
-            ELSE 'B'
-        END a_or_b,
-        CASE 
-            WHEN tur.speaker_role == 'd' AND tsk.a_or_b == 'A'
-            THEN spk_a.sex
-            WHEN tur.speaker_role == 'f' AND tsk.a_or_b == 'B'
-            THEN spk_a.sex
-            ELSE spk_b.sex
-        END sex,
+        tur.a_or_b,
+        spk.sex,
         start_time,
         end_time,
-        CASE
-            WHEN chu_last.chu_id IS NOT NULL
-            THEN 1
-            ELSE 0
-        END is_last_in_turn,
-        CASE
-            WHEN chu_last.chu_id IS NOT NULL AND tur_last.tur_id IS NOT NULL
-            THEN 1
-            ELSE 0
-        END is_last_in_task,
+        tur.is_last_turn,
         CASE
             WHEN chu.pitch_min IS NOT NULL 
             AND  chu.pitch_max IS NOT NULL 
@@ -113,70 +111,106 @@ chu AS
             ELSE 0
         END has_all_features
  FROM   chunks chu
- JOIN   turns tur
+ JOIN   tur
  ON     chu.tur_id == tur.tur_id
  JOIN   tasks tsk
  ON     tur.tsk_id == tsk.tsk_id
- JOIN   sessions ses
- ON     tsk.ses_id == ses.ses_id
- JOIN   speakers spk_a
- ON     ses.spk_id_a == spk_a.spk_id
- JOIN   speakers spk_b
- ON     ses.spk_id_b == spk_b.spk_id
- LEFT JOIN chu_last
- ON     chu.chu_id == chu_last.chu_id
- LEFT JOIN tur_last
- ON     tur.tur_id == tur_last.tur_id
+ JOIN   speakers spk
+ ON     tur.spk_id == spk.spk_id
+),
+chu_seq AS
+(
+ -- each chunk with the next one in its session (by task, turn and chunk index),
+ -- computed in a single pass over the sorted chunks instead of a self-join
+ SELECT chu_id chu_id1,
+        LEAD(chu_id) OVER w chu_id2,
+        tur_id tur_id1,
+        LEAD(tur_id) OVER w tur_id2,
+        tsk_id tsk_id1,
+        LEAD(tsk_id) OVER w tsk_id2,
+        ses_id,
+        spk_id spk_id1,
+        LEAD(spk_id) OVER w spk_id2,
+        chunk_index chunk_index1,
+        LEAD(chunk_index) OVER w chunk_index2,
+        turn_index turn_index1,
+        LEAD(turn_index) OVER w turn_index2,
+        task_index task_index1,
+        LEAD(task_index) OVER w task_index2,
+        speaker_role speaker_role1,
+        LEAD(speaker_role) OVER w speaker_role2,
+        a_or_b speaker1_a_or_b,
+        LEAD(a_or_b) OVER w speaker2_a_or_b,
+        sex sex1,
+        LEAD(sex) OVER w sex2,
+        start_time start1,
+        end_time end1,
+        LEAD(start_time) OVER w start2,
+        LEAD(end_time) OVER w end2,
+        has_all_features has_all_features1,
+        LEAD(has_all_features) OVER w has_all_features2,
+        -- chunk is last in its turn if next chunk is from another turn (or
+        -- there is none), and last in its task if its turn is also last
+        CASE
+            WHEN LEAD(tur_id) OVER w IS NOT tur_id
+            THEN 1
+            ELSE 0
+        END is_last_in_turn1,
+        CASE
+            WHEN LEAD(tur_id) OVER w IS NOT tur_id AND is_last_turn == 1
+            THEN 1
+            ELSE 0
+        END is_last_in_task1
+ FROM   chu
+ WINDOW w AS (PARTITION BY ses_id ORDER BY task_index, turn_index, chunk_index)
 )
-SELECT chu1.chu_id chu_id1,
-       chu2.chu_id chu_id2,
-       chu1.tur_id tur_id1,
-       chu2.tur_id tur_id2,
-       chu1.tsk_id tsk_id1,
-       chu2.tsk_id tsk_id2,
-       chu1.ses_id ses_id,
-       chu1.spk_id spk_id1,
-       chu2.spk_id spk_id2,
-       chu1.chunk_index chunk_index1,
-       chu2.chunk_index chunk_index2,
-       chu1.turn_index turn_index1,
-       chu2.turn_index turn_index2,
-       chu1.task_index task_index1,
-       chu2.task_index task_index2,
-       chu1.speaker_role speaker_role1,
-       chu2.speaker_role speaker_role2,
-       chu1.a_or_b speaker1_a_or_b,
-       chu2.a_or_b speaker2_a_or_b,
-       chu1.sex sex1,
-       chu2.sex sex2,
-       chu1.start_time start1,
-       chu1.end_time end1,
-       chu2.start_time start2,
-       chu2.end_time end2,
-       chu1.has_all_features has_all_features1,
-       chu2.has_all_features has_all_features2
-FROM   chu chu1
-JOIN   chu chu2
-ON     chu1.ses_id == chu2.ses_id
-AND   (
-       (chu1.tsk_id == chu2.tsk_id
-        AND chu1.turn_index == chu2.turn_index 
-        AND chu1.chunk_index + 1 == chu2.chunk_index)
-       OR
-       (chu1.tsk_id == chu2.tsk_id
-        AND chu1.is_last_in_turn == 1
-        AND chu1.turn_index + 1 == chu2.turn_index 
-        AND chu2.chunk_index == 1)
-       OR
-       (chu1.task_index + 1 == chu2.task_index
-        AND chu1.is_last_in_task == 1
-        AND chu2.turn_index == 1
-        AND chu2.chunk_index == 1)
-      )
-ORDER BY chu1.ses_id,
-         chu1.task_index,
-         chu1.turn_index,
-         chu1.chunk_index;
+SELECT chu_id1,
+       chu_id2,
+       tur_id1,
+       tur_id2,
+       tsk_id1,
+       tsk_id2,
+       ses_id,
+       spk_id1,
+       spk_id2,
+       chunk_index1,
+       chunk_index2,
+       turn_index1,
+       turn_index2,
+       task_index1,
+       task_index2,
+       speaker_role1,
+       speaker_role2,
+       speaker1_a_or_b,
+       speaker2_a_or_b,
+       sex1,
+       sex2,
+       start1,
+       end1,
+       start2,
+       end2,
+       has_all_features1,
+       has_all_features2
+FROM   chu_seq
+-- next chunk follows without gap in indices (within turn, to next turn within
+-- task, or to next task)
+WHERE  (tsk_id1 == tsk_id2
+        AND turn_index1 == turn_index2
+        AND chunk_index1 + 1 == chunk_index2)
+OR     (tsk_id1 == tsk_id2
+        AND is_last_in_turn1 == 1
+        AND turn_index1 + 1 == turn_index2
+        AND chunk_index2 == 1)
+OR     (task_index1 + 1 == task_index2
+        AND is_last_in_task1 == 1
+        AND turn_index2 == 1
+        AND chunk_index2 == 1)
+ORDER BY ses_id,
+         task_index1,
+         turn_index1,
+         chunk_index1;
+
+CREATE INDEX con2_chu_fk1 ON consecutive_2_chunks (chu_id1);
 
 
 
@@ -229,15 +263,15 @@ ON     con1.chu_id2 == con2.chu_id1;
 
 
 
-CREATE TABLE chunk_pairs
-AS
+INSERT INTO chunk_pairs (p_or_x, ses_id, chu_id1, chu_id2, rid)
 -- pairs of turn-final and turn-initial chunks;
 -- used to compute local entrainment measures;
 -- some are adjacent ('p'), some are not ('x');
 -- all belong to the same session but not necessarily to the same task;
--- this initial create inserts all adjacent and almost adjacent pairs;
--- non-adjacent pairs are inserted separately below
+-- this insert adds all adjacent and almost adjacent pairs;
+-- non-adjacent pairs are inserted separately (see chp.py)
 SELECT 'p' p_or_x, -- truly adjacent pairs
+       con.ses_id ses_id,
        -- turn-final chunk (adjacent to turn-initial chunk below)
        con.chu_id1 chu_id1,
        -- turn-initial chunk
@@ -260,6 +294,7 @@ UNION ALL
 
 SELECT 'p' p_or_x, -- almost adjacent pairs, treated as adjacent 
        -- (chunk 3 is treated as a response to chunk 1; see note at the top)
+       con.ses_id ses_id,
        -- almost turn-final chunk (almost adjacent to turn-initial chunk below)
        con.chu_id1 chu_id1,
        -- turn-initial chunk
@@ -281,84 +316,6 @@ AND    con.spk_id3 != 0;
 
 
 
-CREATE TABLE tmp
-AS
--- all possible non-adjacent choices per turn-initial chunk in random order; 
--- possible choices are those turn-final or almost turn-final chunks by the same
--- speaker in the same role in the same session as the adjacent chunk and which
--- are included in the analysis as an adjacent or almost adjacent chunk to some
--- other turn-initial chunk
-WITH chu AS
-(
- SELECT chp.chu_id1,
-        chp.chu_id2,
-        ses.ses_id,
-        CASE 
-            WHEN tur1.speaker_role == 'd' AND tsk1.a_or_b == 'A'
-            THEN ses.spk_id_a
-            WHEN tur1.speaker_role == 'f' AND tsk1.a_or_b == 'B'
-            THEN ses.spk_id_a
-            ELSE ses.spk_id_b
-        END spk_id1,
-        tur1.speaker_role speaker_role1
- FROM   chunk_pairs chp
- JOIN   chunks chu1
- ON     chp.chu_id1 == chu1.chu_id
- JOIN   turns tur1
- ON     chu1.tur_id == tur1.tur_id
- JOIN   tasks tsk1
- ON     tur1.tsk_id == tsk1.tsk_id
- JOIN   sessions ses
- ON     tsk1.ses_id == ses.ses_id
-)
-SELECT chu_x.chu_id1,
-       chu_p.chu_id2
-FROM   chu chu_p
-JOIN   chu chu_x
-ON     chu_p.chu_id2 != chu_x.chu_id2
-AND    chu_p.ses_id == chu_x.ses_id
-AND    chu_p.spk_id1 == chu_x.spk_id1
-AND    chu_p.speaker_role1 == chu_x.speaker_role1
-ORDER BY chu_p.chu_id2, RANDOM();
-
-CREATE TABLE tmp2 
-AS
--- rowid per non-adjacent chunk pair (after putting them in random order)
-SELECT chu_id1, 
-       chu_id2,
-       rowid rid
-FROM   tmp;
-
-CREATE TABLE tmp3
-AS
--- span of rowids for non-adjacent choices per turn-initial chunk
-SELECT chu_id2, 
-       min(rid) min_rid,
-       max(rid) max_rid
-FROM   tmp2
-GROUP BY chu_id2;
-
-DROP TABLE tmp;
-
-INSERT INTO chunk_pairs
--- add non-adjacent chunk pairs, at least 10 and at least 25 percent of all 
--- possible choices (see comment on tmp table)
-SELECT 'x' p_or_x,
-       rnd.chu_id1 chu_id1,
-       rnd.chu_id2 chu_id2,
-       rnd.rid - ids.min_rid rid
-FROM   tmp2 rnd
-JOIN   tmp3 ids
-ON     rnd.chu_id2 == ids.chu_id2
-WHERE  rnd.rid < ids.min_rid + MAX(10, 0.25*(ids.max_rid-ids.min_rid+1));
-
-
-
-CREATE INDEX chp_chu_fk1 ON chunk_pairs (chu_id1);
-CREATE INDEX chp_chu_fk2 ON chunk_pairs (chu_id2);
-
-DROP TABLE tmp2;
-DROP TABLE tmp3;
 DROP TABLE consecutive_2_chunks;
 DROP TABLE consecutive_3_chunks;
 
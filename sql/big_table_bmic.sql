@@ -70,130 +70,6 @@ WITH halfway_points AS
          FROM   speakers
          WHERE  spk_id != 0
         ) spk
-), spk AS
-(
- SELECT tur.tur_id,
-        CASE
-            WHEN tsk.a_or_b == "A" AND tur.speaker_role == "d"
-            THEN "A"
-            WHEN tsk.a_or_b == "B" AND tur.speaker_role == "f"
-            THEN "A"
-            ELSE "B"
-        END speaker_a_or_b,
-        CASE
-            WHEN tsk.a_or_b == "A" AND tur.speaker_role == "d"
-            THEN spk_a.spk_id
-            WHEN tsk.a_or_b == "B" AND tur.speaker_role == "f"
-            THEN spk_a.spk_id
-            ELSE spk_b.spk_id
-        END spk_id,
-        CASE
-            WHEN tsk.a_or_b == "A" AND tur.speaker_role == "d"
-            THEN spk_a.subject_index
-            WHEN tsk.a_or_b == "B" AND tur.speaker_role == "f"
-            THEN spk_a.subject_index
-            ELSE spk_b.subject_index
-        END subject_index,
-        CASE
-            WHEN tsk.a_or_b == "A" AND tur.speaker_role == "d"
-            THEN spk_a.age
-            WHEN tsk.a_or_b == "B" AND tur.speaker_role == "f"
-            THEN spk_a.age
-            ELSE spk_b.age
-        END age,
-        CASE
-            WHEN tsk.a_or_b == "A" AND tur.speaker_role == "d"
-            THEN spk_a.sex
-            WHEN tsk.a_or_b == "B" AND tur.speaker_role == "f"
-            THEN spk_a.sex
-            ELSE spk_b.sex
-        END sex,
-        CASE
-            WHEN tsk.a_or_b == "A" AND tur.speaker_role == "d"
-            THEN spk_a.gender_identification
-            WHEN tsk.a_or_b == "B" AND tur.speaker_role == "f"
-            THEN spk_a.gender_identification
-            ELSE spk_b.gender_identification
-        END gender_identification,
-        CASE
-            WHEN tsk.a_or_b == "A" AND tur.speaker_role == "d"
-            THEN spk_a.racial_identification
-            WHEN tsk.a_or_b == "B" AND tur.speaker_role == "f"
-            THEN spk_a.racial_identification
-            ELSE spk_b.racial_identification
-        END racial_identification,
-        CASE
-            WHEN tsk.a_or_b == "A" AND tur.speaker_role == "d"
-            THEN spk_a.hispanic
-            WHEN tsk.a_or_b == "B" AND tur.speaker_role == "f"
-            THEN spk_a.hispanic
-            ELSE spk_b.hispanic
-        END hispanic,
-        CASE
-            WHEN tsk.a_or_b == "A" AND tur.speaker_role == "d"
-            THEN spk_a.tipi_o
-            WHEN tsk.a_or_b == "B" AND tur.speaker_role == "f"
-            THEN spk_a.tipi_o
-            ELSE spk_b.tipi_o
-        END tipi_o,
-        CASE
-            WHEN tsk.a_or_b == "A" AND tur.speaker_role == "d"
-            THEN spk_a.tipi_c
-            WHEN tsk.a_or_b == "B" AND tur.speaker_role == "f"
-            THEN spk_a.tipi_c
-            ELSE spk_b.tipi_c
-        END tipi_c,
-        CASE
-            WHEN tsk.a_or_b == "A" AND tur.speaker_role == "d"
-            THEN spk_a.tipi_e
-            WHEN tsk.a_or_b == "B" AND tur.speaker_role == "f"
-            THEN spk_a.tipi_e
-            ELSE spk_b.tipi_e
-        END tipi_e,
-        CASE
-            WHEN tsk.a_or_b == "A" AND tur.speaker_role == "d"
-            THEN spk_a.tipi_a
-            WHEN tsk.a_or_b == "B" AND tur.speaker_role == "f"
-            THEN spk_a.tipi_a
-            ELSE spk_b.tipi_a
-        END tipi_a,
-        CASE
-            WHEN tsk.a_or_b == "A" AND tur.speaker_role == "d"
-            THEN spk_a.tipi_n
-            WHEN tsk.a_or_b == "B" AND tur.speaker_role == "f"
-            THEN spk_a.tipi_n
-            ELSE spk_b.tipi_n
-        END tipi_n,
-        CASE
-            WHEN tsk.a_or_b == "A" AND tur.speaker_role == "d"
-            THEN spk_a.mc_sds
-            WHEN tsk.a_or_b == "B" AND tur.speaker_role == "f"
-            THEN spk_a.mc_sds
-            ELSE spk_b.mc_sds
-        END mc_sds,
-        CASE
-            WHEN tsk.a_or_b == "A" AND tur.speaker_role == "d"
-            THEN spk_a.iri_pt
-            WHEN tsk.a_or_b == "B" AND tur.speaker_role == "f"
-            THEN spk_a.iri_pt
-            ELSE spk_b.iri_pt
-        END iri_pt,
-        CASE
-            WHEN tsk.a_or_b == "A" AND tur.speaker_role == "d"
-            THEN spk_a.rmi
-            WHEN tsk.a_or_b == "B" AND tur.speaker_role == "f"
-            THEN spk_a.rmi
-            ELSE spk_b.rmi
-        END rmi
- FROM   turns tur
- JOIN   tasks tsk
- ON     tur.tsk_id == tsk.tsk_id
- JOIN   sessions ses
- ON     tsk.ses_id == ses.ses_id
- JOIN   speakers spk_a
- ON     ses.spk_id_a == spk_a.spk_id
- JOIN   speakers spk_b
- ON     ses.spk_id_b == spk_b.spk_id
 )
 
 
@@ -265,7 +141,7 @@ SELECT grp.grp_id,
        ses.spk_a_likeable,
        ses.spk_b_likeable,
        ses.init_time,
-       spk.speaker_a_or_b,
+       tur.a_or_b speaker_a_or_b,
        spk.spk_id,
        spk.subject_index,
        spk.age,
@@ -325,11 +201,9 @@ SELECT grp.grp_id,
        -- other paired info can be loaded for only real/fake turn exchanges  
        -- using extra_cols in ap._load_pairs()
        CASE
-           WHEN tsk.a_or_b == "A" AND tur.speaker_role == "d"
-           THEN spk_b.spk_id
-           WHEN tsk.a_or_b == "B" AND tur.speaker_role == "f"
-           THEN spk_b.spk_id
-           ELSE spk_a.spk_id
+           WHEN tur.a_or_b == "A"
+           THEN ses.spk_id_b
+           ELSE ses.spk_id_a
        END partner_spk_id
 FROM   chunks chu
 JOIN   turns tur
@@ -338,10 +212,8 @@ JOIN   tasks tsk
 ON     tur.tsk_id == tsk.tsk_id
 JOIN   sessions ses
 ON     tsk.ses_id == ses.ses_id
-JOIN   speakers spk_a
-ON     ses.spk_id_a == spk_a.spk_id
-JOIN   speakers spk_b
-ON     ses.spk_id_b == spk_b.spk_id
+JOIN   speakers spk
+ON     tur.spk_id == spk.spk_id
 JOIN   groups grp
 ON     ses.grp_id == grp.grp_id
 JOIN   halfway_points hlf_tsk
@@ -363,8 +235,6 @@ LEFT JOIN (
 ON     tsk.ses_id == tsk_prev.ses_id
 AND    tsk.task_index == (tsk_prev.task_index + 1)
 JOIN   stats
-JOIN   spk
-ON     tur.tur_id == spk.tur_id
 WHERE  chu.do_include == 1
 ORDER BY ses.ses_id, tsk.task_index, tur.turn_index, chu.chunk_index;
 
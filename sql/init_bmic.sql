@@ -10,6 +10,7 @@ DROP TABLE IF EXISTS questions;
 DROP TABLE IF EXISTS questionnaires;
 
 DROP TABLE IF EXISTS chunk_pairs;
+DROP TABLE IF EXISTS chunk_pair_stamps;
 DROP TABLE IF EXISTS halfway_points;
 
 DROP TABLE IF EXISTS chunks;
@@ -127,8 +128,14 @@ CREATE TABLE turns (
     turn_index_ses         INTEGER NOT NULL,
     -- whether "d"(escriber) or "f"(ollower) is speaking
     speaker_role           TEXT NOT NULL,
+    -- whether speaker a or b is speaking and who that is; redundant (follows
+    -- from speaker_role and tasks/sessions), set by db.ins_tur (and
+    -- db.set_tur_speakers) to avoid joins for the most common lookup
+    a_or_b                 TEXT,
+    spk_id                 INTEGER,
     PRIMARY KEY (tur_id),
-    FOREIGN KEY (tsk_id) REFERENCES tasks (tsk_id)
+    FOREIGN KEY (tsk_id) REFERENCES tasks (tsk_id),
+    FOREIGN KEY (spk_id) REFERENCES speakers (spk_id)
 );
 
 CREATE TABLE turn_annotations (
@@ -229,12 +236,15 @@ CREATE UNIQUE INDEX tsk_uk ON tasks (ses_id, task_index);
 CREATE UNIQUE INDEX tur_pk ON turns (tur_id);
 CREATE UNIQUE INDEX tur_uk ON turns (tur_id, turn_index);
 CREATE INDEX tur_tsk_fk ON turns (tsk_id);
+CREATE INDEX tur_tsk_ord ON turns (tsk_id, turn_index);
+CREATE INDEX tur_spk_fk ON turns (spk_id);
 CREATE UNIQUE INDEX tan_pk ON turn_annotations (tan_id);
 CREATE UNIQUE INDEX tan_uk ON turn_annotations (tur_id, annotator, ann_index);
 CREATE INDEX tan_tur_fk ON turn_annotations (tur_id);
 CREATE UNIQUE INDEX chu_pk ON chunks (chu_id);
 CREATE UNIQUE INDEX chu_uk ON chunks (chu_id, chunk_index);
 CREATE INDEX chu_tur_fk ON chunks (tur_id);
+CREATE INDEX chu_tur_ord ON chunks (tur_id, chunk_index);
 
 
 
@@ -0,0 +1,82 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'python'))
+import sig
+
+# checks pitch, jitter, and shimmer of sig.get_features on synthetic signals
+# for which the values are known exactly
+
+
+
+################################################################################
+#                                   SIGNALS                                    #
+################################################################################
+
+def _get_tone(f0, rate, dur=1.0, phase=0.3):
+    ''' returns pure tone of given frequency '''
+    t = np.arange(int(dur * rate)) / rate
+    return 0.5 * np.sin(2 * np.pi * f0 * t + phase)
+
+
+def _get_cycles(f0, rate, period_dev, amp_dev, dur=1.0):
+    ''' returns sine cycles with alternately longer and shorter periods
+
+    args:
+        f0: mean frequency
+        rate: sample rate
+        period_dev: relative deviation of each period from 1 / f0
+        amp_dev: relative deviation of each cycle's amplitude from 0.5
+    returns:
+        numpy array of samples; local jitter is period_dev, local shimmer
+        2 * amp_dev
+    '''
+    signs = (-1) ** np.arange(int(dur * f0))
+    periods = (1 + period_dev * signs) / f0
+    edges = np.concatenate([[0], np.cumsum(periods)])
+    t = np.arange(int(edges[-1] * rate)) / rate
+    k = np.searchsorted(edges, t, side='right') - 1
+    return 0.5 * (1 + amp_dev * signs[k]) \
+        * np.sin(2 * np.pi * (t - edges[k]) / periods[k])
+
+
+
+################################################################################
+#                                    TESTS                                     #
+################################################################################
+
+class GetFeaturesTest(unittest.TestCase):
+    def test_pure_tone(self):
+        # periods must not be quantized to whole samples (praat gives ~0)
+        for rate in [16000, 44100]:
+            for f0 in [80, 100, 150, 220, 310, 450]:
+                features = sig.get_features(_get_tone(f0, rate), rate)
+                self.assertAlmostEqual(features['f0_mean'], f0,
+                                       delta=0.001 * f0)
+                self.assertLess(features['jitter'], 1e-4)
+                self.assertLess(features['shimmer'], 1e-4)
+
+    def test_perturbed_cycles(self):
+        # (small deviations only; larger ones make the alternation the period)
+        rate = 16000
+        for f0, period_dev, amp_dev in [(120, 0.01, 0.05), (200, 0.005, 0.02),
+                                        (100, 0.015, 0.08)]:
+            features = sig.get_features(
+                _get_cycles(f0, rate, period_dev, amp_dev), rate)
+            self.assertAlmostEqual(features['f0_mean'], f0, delta=0.01 * f0)
+            self.assertAlmostEqual(features['jitter'], period_dev,
+                                   delta=0.05 * period_dev)
+            self.assertAlmostEqual(features['shimmer'], 2 * amp_dev,
+                                   delta=0.05 * 2 * amp_dev)
+
+    def test_silence(self):
+        features = sig.get_features(np.zeros(16000), 16000)
+        for key in ['f0_mean', 'jitter', 'shimmer']:
+            self.assertIsNone(features[key])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import collections
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'python'))
+import vad_asr
+
+# checks that the vectorized vad_asr._get_intervals yields the same intervals
+# as the frame-by-frame ring buffer algorithm it replaced
+
+
+
+################################################################################
+#                                  REFERENCE                                   #
+################################################################################
+
+def _get_intervals_ref(frames):
+    ''' previous ring buffer implementation of vad_asr._get_intervals
+
+    args:
+        frames: list of (start, end, is_sounding) tuples
+    '''
+    get_label = lambda is_sounding: \
+        'sounding' if is_sounding else 'silent'
+    buf = collections.deque(maxlen=20)
+    in_sound_interval = False
+    intervals = [[0.0, 0.0, get_label(False)]]
+    for frame in frames:
+        if not in_sound_interval:
+            buf.append(frame)
+            # number of sounding frames in buffer
+            cnt_snd = len([f for f in buf if f[2]])
+            # position of last silent frame in buffer (0 if none)
+            max_sil = max([i + 1 for i, f in enumerate(buf) 
+                           if not f[2]] + [0])
+            # position of first sounding frame in buffer
+            # (or buf.maxlen+1 if there are none)
+            min_snd = min([i + 1 for i, f in enumerate(buf) 
+                           if f[2]] + [buf.maxlen+1])
+            
+            if (cnt_snd >= 0.7 * buf.maxlen) \
+            or (len(buf) - max_sil > 4):
+                # most frames in buffer or last five are sounding
+                # -> switch state
+                in_sound_interval = True
+                if cnt_snd != len(buf):
+                    intervals[-1][1] = buf[min_snd-1][0]
+                elif len(intervals) == 1:
+                    # audio begins with sounding interval, 
+                    # remove empty initial silent interval
+                    intervals = []
+                intervals += [[buf[min_snd-1][0],
+                               buf[-1][1],
+                               get_label(True)]]
+                buf.clear()
+        else:
+            buf.append(frame)
+            # number of silent frames in buffer
+            cnt_sil = len([f for f in buf if not f[2]])
+            # position of last sounding frame in buffer (0 if none)
+            max_snd = max([i + 1 for i, f in enumerate(buf) 
+                           if f[2]] + [0])
+            # switch state if last 5 in buffer are silent 
+            if len(buf) - max_snd > 4:
+                in_sound_interval = False
+                if cnt_sil != len(buf):
+                    intervals[-1][1] = buf[max_snd-1][1]
+                    intervals += [[buf[max_snd-1][1],
+                                   buf[-1][1],
+                                   get_label(False)]]
+                else:
+                    intervals += [[buf[0][0],
+                                   buf[-1][1],
+                                   get_label(False)]]
+                buf.clear()
+    intervals[-1][1] = frames[-1][1]
+    return intervals
+
+
+def _to_tuples(frames):
+    ''' converts boolean frames to (start, end, is_sounding) tuples (10ms) '''
+    return [(round(i * 0.01, 2), round(i * 0.01 + 0.01, 2), bool(f))
+            for i, f in enumerate(frames)]
+
+
+
+################################################################################
+#                                    TESTS                                     #
+################################################################################
+
+class GetIntervalsTest(unittest.TestCase):
+    def check(self, frames):
+        frames = np.array(frames, dtype=bool)
+        self.assertEqual(vad_asr._get_intervals(frames),
+                         _get_intervals_ref(_to_tuples(frames)))
+
+    def test_empty(self):
+        # (reference fails without frames; one empty silent interval)
+        self.assertEqual(vad_asr._get_intervals(np.zeros(0, dtype=bool)),
+                         [[0.0, 0.0, 'silent']])
+
+    def test_all_sounding(self):
+        for n in [1, 4, 5, 13, 14, 20, 100]:
+            self.check([True] * n)
+
+    def test_all_silent(self):
+        for n in [1, 4, 5, 20, 100]:
+            self.check([False] * n)
+
+    def test_starts_with_sound(self):
+        self.check([True] * 30 + [False] * 30 + [True] * 30)
+        self.check([True] * 5 + [False] * 10)
+
+    def test_run_lengths(self):
+        # runs just below/at the thresholds (last five frames in buffer,
+        # 70 percent of buffer), between silence of varying length
+        for n in [4, 5, 13, 14]:
+            for pad in [0, 3, 4, 5, 6, 25]:
+                self.check([False] * pad + [True] * n + [False] * pad)
+                self.check([True] * pad + [False] * n + [True] * pad)
+                self.check(([False] * pad + [True] * n) * 3)
+
+    def test_random(self):
+        rng = np.random.default_rng(0)
+        for i in range(500):
+            n = int(rng.integers(1, 600))
+            # runs of random length rather than independent frames
+            p = rng.uniform(0.05, 0.5)
+            flips = rng.random(n) < p
+            frames = np.logical_xor.accumulate(flips) ^ (rng.random() < 0.5)
+            self.check(frames)
+        for i in range(200):
+            self.check(rng.random(int(rng.integers(1, 300))) < 0.6)
+
+
+if __name__ == '__main__':
+    unittest.main()